@@ -0,0 +1,203 @@
+# Annotate
+# Look up the block of every full phone number in a list, a chunk at a time,
+# or keep just the numbers in assigned blocks
+import re
+import sys
+import numpy as np
+import db_cache
+import lightning_searcher
+import streaming
+
+# Columns written after every number
+ANNOTATE_COLUMNS = ["state", "rate_center", "carrier", "ocn", "contaminated", "tn_not_available", "status"]
+
+# Lines read, looked up and written at a time
+CHUNK_LINES = streaming.CHUNK_SIZE
+
+_NON_DIGITS = re.compile(r'\D')
+
+
+def read_chunks(stream, chunk_lines=CHUNK_LINES):
+    """Read non-empty lines a chunk at a time
+
+    Args:
+        stream (file): text stream to read
+        chunk_lines (int, optional): about how many lines per chunk
+
+    Yields:
+        list: lines, without line endings
+    """
+    # Read in big blocks and split them, much faster than line by line. A
+    # partial last line is carried over to the next block.
+    read_size = chunk_lines * 11
+    carry = ''
+    while True:
+        data = stream.read(read_size)
+        if not data:
+            break
+        lines = (carry + data).splitlines()
+        # A block ending in a line break ends on a whole line, a \r\n pair
+        # split between blocks just leaves an extra blank line
+        carry = '' if data[-1] in '\r\n' else lines.pop()
+        if '' in lines:
+            lines = list(filter(None, lines))
+        if lines:
+            yield lines
+    if carry:
+        yield [carry]
+
+
+def _normalize(text) -> int:
+    # Slow path for anything but 10 bare digits, ex: (312) 555-0100 or +1 312 555 0100
+    digits = _NON_DIGITS.sub('', text)
+    if len(digits) == 11 and digits[0] == '1':
+        digits = digits[1:]
+    return int(digits) if len(digits) == 10 else -1
+
+
+def parse_numbers(lines) -> tuple:
+    """Turn lines into 10 digit phone numbers
+
+    Lines of exactly 10 digits are converted in bulk. Anything else has its
+    punctuation and a leading country code 1 stripped, one line at a time.
+
+    Args:
+        lines (list): one phone number per line
+
+    Returns:
+        tuple: (numbers as np.int64, -1 where a line isn't a phone number,
+        mask of the lines that had to be cleaned up to get their number)
+    """
+    lengths = np.fromiter(map(len, lines), dtype=np.int64, count=len(lines))
+    numbers = np.full(len(lines), -1, dtype=np.int64)
+    bare = lengths == 10
+    if bare.all() and all(map(str.isascii, lines)):
+        # The usual case, a list of bare numbers: read them as one 10 column
+        # byte matrix
+        digits = np.frombuffer(''.join(lines).encode('ascii'), dtype=np.uint8).reshape(-1, 10)
+    elif bare.any():
+        # Read the code points of every 10 character line as a 10 column matrix
+        digits = np.array(lines, dtype=object)[bare].astype('U10').view(np.uint32).reshape(-1, 10)
+    else:
+        digits = None
+    if digits is not None:
+        values = np.zeros(len(digits), dtype=np.int64)
+        valid = np.ones(len(digits), dtype=bool)
+        for column in digits.T:
+            digit = column.astype(np.int64) - ord('0')
+            valid &= (digit >= 0) & (digit <= 9)
+            values = values * 10 + digit
+        numbers[bare] = np.where(valid, values, -1)
+    cleaned = np.zeros(len(lines), dtype=bool)
+    for i in np.flatnonzero(numbers < 0).tolist():
+        numbers[i] = _normalize(lines[i])
+        cleaned[i] = numbers[i] >= 0
+    return numbers, cleaned
+
+
+def annotate_chunk(blocks, lines, writer) -> int:
+    """Look up and write one chunk of numbers
+
+    Args:
+        blocks (db_cache.BlockTable): the table
+        lines (list): phone numbers, one per line
+        writer (streaming.StreamWriter): where to write the annotated numbers
+
+    Returns:
+        int: how many numbers were found in the table
+    """
+    numbers, cleaned = parse_numbers(lines)
+    rows = blocks.index.number_rows(numbers)
+    # Lines are written back as they came in, only cleaned up numbers are
+    # written as 10 bare digits, and lines that aren't numbers are escaped
+    text = np.array(lines, dtype=object)
+    text[cleaned] = lightning_searcher.format_numbers(numbers[cleaned]).astype(object)
+    for i in np.flatnonzero(numbers < 0).tolist():
+        text[i] = writer.number_text(lines[i])
+    writer.write_scattered(text, rows)
+    return int(np.count_nonzero(rows >= 0))
+
+
+def run_annotate(source='-', output='-', output_format=None, datafile='./phone_numbers.csv',
+                 blocks=None, chunk_lines=CHUNK_LINES) -> tuple:
+    """Annotate every number in a file with the block it belongs to
+
+    Output rows keep the input order. Numbers outside every block (or
+    that aren't phone numbers) are written with empty columns.
+
+    Args:
+        source (str, optional): file to read, '-' for stdin
+        output (str, optional): file to write to, '-' for stdout
+        output_format (str, optional): csv or jsonl. Defaults to a guess from
+        the file extension, csv for stdout.
+        datafile (str, optional): path to phone_numbers.csv
+        blocks (db_cache.BlockTable, optional): already loaded table
+        chunk_lines (int, optional): lines handled at a time
+
+    Returns:
+        tuple: (numbers read, numbers found)
+    """
+    if output_format is None:
+        output_format = 'csv' if output == '-' else streaming.format_for_path(output)
+    blocks = blocks if blocks is not None else db_cache.load_cache(datafile)
+
+    instream = sys.stdin if source == '-' else open(source, 'r', encoding='utf-8')
+    outstream = streaming.open_output(output)
+    writer = streaming.WRITERS[output_format](outstream, blocks, ANNOTATE_COLUMNS)
+    found = 0
+    try:
+        for lines in read_chunks(instream, chunk_lines):
+            found += annotate_chunk(blocks, lines, writer)
+        writer.close()
+    finally:
+        if instream is not sys.stdin:
+            instream.close()
+        if outstream is not sys.stdout:
+            outstream.close()
+    return writer.count, found
+
+
+def run_validate(source='-', output='-', include_contaminated=False, invert=False,
+                 datafile='./phone_numbers.csv', blocks=None, chunk_lines=CHUNK_LINES) -> tuple:
+    """Keep only the numbers of a candidate list that are in an assigned block
+
+    Numbers are checked against the block bitmap and written as 10 bare
+    digits, one per line, in input order. Lines that aren't phone numbers
+    are dropped.
+
+    Args:
+        source (str, optional): file to read, '-' for stdin
+        output (str, optional): file to write to, '-' for stdout
+        include_contaminated (bool, optional): keep numbers in contaminated blocks
+        invert (bool, optional): keep the numbers that aren't valid instead
+        datafile (str, optional): path to phone_numbers.csv
+        blocks (db_cache.BlockTable, optional): already loaded table
+        chunk_lines (int, optional): lines handled at a time
+
+    Returns:
+        tuple: (numbers read, numbers written)
+    """
+    blocks = blocks if blocks is not None else db_cache.load_cache(datafile)
+    bitmap = blocks.bitmap
+
+    instream = sys.stdin if source == '-' else open(source, 'r', encoding='utf-8')
+    outstream = streaming.open_output(output)
+    read = written = 0
+    try:
+        for lines in read_chunks(instream, chunk_lines):
+            numbers, _ = parse_numbers(lines)
+            keep = bitmap.is_valid(numbers, include_contaminated)
+            if invert:
+                keep = ~keep & (numbers >= 0)
+            kept = lightning_searcher.format_numbers(numbers[keep])
+            if len(kept):
+                outstream.write('\n'.join(kept.tolist()) + '\n')
+            read += len(lines)
+            written += len(kept)
+        outstream.flush()
+    finally:
+        if instream is not sys.stdin:
+            instream.close()
+        if outstream is not sys.stdout:
+            outstream.close()
+    return read, written
@@ -0,0 +1,183 @@
+# Batch Search
+# Resolve many masked numbers with a single load of the database
+import io
+import os
+import sys
+import db_cache
+import lightning_searcher
+import parallel
+import streaming
+
+# Patterns searched per pool task, enough that a task outweighs handing it
+# out when the patterns are narrow (a couple of milliseconds each)
+PATTERNS_PER_TASK = 64
+
+
+def read_patterns(source) -> list:
+    """Read masked numbers, one per line
+
+    Args:
+        source (str): file to read, '-' for stdin
+
+    Returns:
+        list: patterns in input order, blank lines and # comments skipped
+    """
+    stream = sys.stdin if source == '-' else open(source, 'r', encoding='utf-8')
+    try:
+        return [line.strip() for line in stream
+                if line.strip() and not line.lstrip().startswith('#')]
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def search_patterns(patterns, include_contaminated=False, filters=None, blocks=None):
+    """Search patterns one at a time, in input order
+
+    Args:
+        patterns (list): masked numbers
+        include_contaminated (bool, optional): include contaminated blocks
+        filters (list, optional): filters.ColumnFilter objects
+        blocks (db_cache.BlockTable): table to search
+
+    Yields:
+        tuple: (pattern, lightning_searcher.LightningSearch with its rows
+        selected, or None and the error if the pattern isn't valid)
+    """
+    for pattern in patterns:
+        try:
+            yield pattern, lightning_searcher.search(pattern, include_contaminated, filters, blocks=blocks), None
+        except ValueError as error:
+            yield pattern, None, f"[PHONEBRUTE] Skipping {pattern}: {error}"
+
+
+def search_group(patterns, output_format, include_contaminated=False, filters=None) -> tuple:
+    """Search and render a group of patterns in a worker process
+
+    Small results are rendered together, up to parallel.SHARD_SIZE numbers
+    at a time. A pattern with more numbers than that is only searched, and
+    its rows are handed back cut into shards, for the parent to spread over
+    the pool.
+
+    Args:
+        patterns (list): masked numbers, consecutive in the input
+        output_format (str): csv, jsonl or txt
+        include_contaminated (bool, optional): include contaminated blocks
+        filters (list, optional): filters.ColumnFilter objects
+
+    Returns:
+        tuple: (pieces in input order, how many patterns were searched). A
+        piece is ('text', handle for parallel.write_shard), ('error', message)
+        or ('split', pattern, list of row arrays).
+    """
+    pieces = []
+    output = io.StringIO()
+    rendered = searched = 0
+
+    def flush():
+        nonlocal output, rendered
+        if rendered:
+            pieces.append(('text', (parallel.hand_off(output.getvalue().encode('utf-8')), rendered)))
+            output, rendered = io.StringIO(), 0
+
+    for pattern, lightning_search, error in search_patterns(patterns, include_contaminated, filters,
+                                                             parallel.worker_blocks()):
+        if error is not None:
+            flush()
+            pieces.append(('error', error))
+            continue
+        searched += 1
+        if lightning_search.total_numbers() > parallel.SHARD_SIZE:
+            flush()
+            pieces.append(('split', pattern, list(lightning_search.split_rows(parallel.SHARD_SIZE))))
+            continue
+        rendered += lightning_search.write_stream(output, output_format, tag=pattern, header=False)
+        if rendered >= parallel.SHARD_SIZE:
+            flush()
+    flush()
+    return pieces, searched
+
+
+def run_batch(patterns, output='-', output_format=None, include_contaminated=False, filters=None,
+              jobs=None, datafile='./phone_numbers.csv') -> int:
+    """Search many patterns and write every result tagged with its pattern
+
+    Results come out in input order, pattern by pattern. With more than one
+    job, consecutive patterns are searched and rendered in the pool
+    PATTERNS_PER_TASK at a time, and a pattern with more than
+    parallel.SHARD_SIZE numbers is split into shards spread over the pool,
+    so memory stays bounded.
+
+    Args:
+        patterns (list): masked numbers
+        output (str, optional): file to write to, '-' for stdout
+        output_format (str, optional): csv, jsonl or txt. Defaults to a guess
+        from the file extension.
+        include_contaminated (bool, optional): include contaminated blocks
+        filters (list, optional): filters.ColumnFilter objects
+        jobs (int, optional): worker processes. Defaults to one per core.
+        datafile (str, optional): path to phone_numbers.csv
+
+    Returns:
+        int: how many patterns were searched, invalid ones are skipped
+    """
+    output_format = output_format or streaming.format_for_path(output)
+    jobs = jobs or os.cpu_count() or 1
+    # Build or refresh the cache once, up front, rather than in every worker
+    blocks = db_cache.load_cache(datafile)
+
+    # Write the header once, every pattern is written without one
+    header = io.StringIO()
+    streaming.WRITERS[output_format](header, blocks, lightning_searcher.TABLE_HEADERS[1:], tag='').close()
+
+    searched = 0
+    if jobs > 1 and len(patterns) > 1:
+        in_flight = jobs * parallel.SHARDS_IN_FLIGHT
+
+        def write_group(stream, result):
+            nonlocal searched
+            pieces, group_searched = result
+            searched += group_searched
+            written = 0
+            for piece in pieces:
+                if piece[0] == 'text':
+                    written += parallel.write_shard(stream, piece[1])
+                elif piece[0] == 'error':
+                    print(piece[1], file=sys.stderr)
+                else:
+                    _, pattern, shards = piece
+                    written += parallel.write_in_order(
+                        stream, executor, ((parallel.render_shard, (pattern, rows, output_format, pattern))
+                                           for rows in shards), in_flight)
+            return written
+
+        groups = (patterns[start:start + PATTERNS_PER_TASK] for start in range(0, len(patterns), PATTERNS_PER_TASK))
+        if output == '-':
+            sys.stdout.flush()
+        stream = sys.stdout.buffer if output == '-' else open(output, 'wb')
+        try:
+            stream.write(header.getvalue().encode('utf-8'))
+            with parallel.start_pool(jobs, blocks.path) as executor:
+                parallel.write_in_order(stream, executor,
+                                        ((search_group, (group, output_format, include_contaminated, filters))
+                                         for group in groups), in_flight, write_group)
+        finally:
+            if output == '-':
+                stream.flush()
+            else:
+                stream.close()
+        return searched
+
+    stream = streaming.open_output(output)
+    try:
+        stream.write(header.getvalue())
+        for pattern, lightning_search, error in search_patterns(patterns, include_contaminated, filters, blocks):
+            if error is not None:
+                print(error, file=sys.stderr)
+                continue
+            lightning_search.write_stream(stream, output_format, tag=pattern, header=False)
+            searched += 1
+    finally:
+        if stream is not sys.stdout:
+            stream.close()
+    return searched
@@ -0,0 +1,352 @@
+# Benchmark
+# Time and memory-profile every stage of a search against a synthetic
+# (or real) report, and save the results as JSON for later comparison
+import io
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import statistics
+import subprocess
+import tracemalloc
+import contextlib
+import numpy as np
+import pandas as pd
+from tabulate import tabulate
+import db_cache
+import lightning_searcher
+import synthetic_data
+
+# Bump when the layout of the results file changes
+RESULTS_VERSION = 1
+
+WILDCARDS = range(0, 8)
+
+# Slower than this relative to the baseline is reported as a regression
+REGRESSION_RATIO = 1.2
+
+PHONEBRUTE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'phonebrute.py')
+
+# Command line runs timed from process start to exit: name -> (arguments,
+# seconds allowed, whether pandas may be imported). PATTERN is replaced
+# with a pattern that has results, NUMBER with a full number that has one.
+STARTUP_RUNS = {
+    'startup_help' : (['-h'], 0.25, False),
+    'startup_bad_input' : (['12345'], 0.25, False),
+    'startup_count' : (['PATTERN', '--local', '-C'], 0.6, False),
+    'startup_stream' : (['PATTERN', '--local', '-S', '-f', 'txt', '-o', 'numbers.txt'], 0.6, False),
+    'startup_print' : (['NUMBER', '--local'], 0.6, False),
+    'startup_export' : (['PATTERN', '--local', '-nP', '-o', 'numbers.csv'], None, True)
+}
+
+
+def git_commit():
+    """
+    The commit being benchmarked, None outside of a git checkout
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def measure(run, setup=None, repeat=3) -> dict:
+    """Time a stage, then run it once more under tracemalloc for its peak memory
+
+    Timings don't include tracemalloc, which slows allocation heavy code down.
+
+    Args:
+        run (callable): the stage, takes the result of setup and returns
+        the number of rows it produced
+        setup (callable, optional): builds fresh input for every run, not timed
+        repeat (int, optional): number of timed runs
+
+    Returns:
+        dict: seconds (best run), median_seconds, peak_bytes and rows
+    """
+    setup = setup or (lambda: None)
+    timings = []
+    for _ in range(repeat):
+        state = setup()
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            rows = run(state)
+            timings.append(time.perf_counter() - start)
+
+    state = setup()
+    tracemalloc.start()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            run(state)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'seconds' : min(timings),
+        'median_seconds' : statistics.median(timings),
+        'peak_bytes' : peak,
+        'rows' : int(rows)
+    }
+
+
+def benchmark_patterns(blocks) -> list:
+    """Patterns with 0 to 7 trailing wildcards, all around one real exchange
+
+    The exchange is taken from the NPA with the most blocks, so every
+    pattern has results and the wide ones are as large as they get.
+
+    Args:
+        blocks (db_cache.BlockTable): the table
+
+    Returns:
+        list: (wildcards, pattern) tuples
+    """
+    npa = np.bincount(blocks.columns['NPA']).argmax()
+    clean = blocks.columns['contaminated'] == blocks.code_of('contaminated', 'N')
+    row = np.flatnonzero((blocks.columns['NPA'] == npa) & clean & (blocks.columns['x'] >= 0))[0]
+    number = f"{npa:03d}{blocks.columns['NXX'][row]:03d}{blocks.columns['x'][row]}555"
+    return [(wildcards, number[:10 - wildcards] + 'X' * wildcards) for wildcards in WILDCARDS]
+
+
+def run_benchmarks(datafile, workdir, wildcards=WILDCARDS, repeat=3, filter_column='carrier',
+                   filter_regex='WIRELESS') -> list:
+    """Benchmark loading the report and every search stage
+
+    Args:
+        datafile (str): report to benchmark against
+        workdir (str): scratch directory for the cache and exports
+        wildcards (iterable, optional): pattern shapes to run, by number of wildcards
+        repeat (int, optional): timed runs per stage
+        filter_column (str, optional): column for advanced_dataframe_search
+        filter_regex (str, optional): regex for advanced_dataframe_search
+
+    Returns:
+        list: one result dict per stage and pattern
+    """
+    results = []
+    cache_path = os.path.join(workdir, 'bench.cache')
+
+    def record(stage, result, pattern=None, pattern_wildcards=None):
+        result.update(stage=stage, pattern=pattern, wildcards=pattern_wildcards)
+        results.append(result)
+        label = f"{stage} {pattern}" if pattern else stage
+        print(f"[PHONEBRUTE] {label}: {result['seconds']:.4f}s, {result['rows']} rows", file=sys.stderr)
+
+    record('csv_load', measure(
+        lambda _: len(pd.read_csv(datafile, names=db_cache.COLUMN_NAMES, na_values='NONE', dtype=str)),
+        repeat=repeat))
+    record('cache_build', measure(lambda _: len(db_cache.build_cache(datafile, cache_path)), repeat=repeat))
+
+    def load(_):
+        blocks = db_cache.load_cache(datafile, cache_path)
+        blocks.index
+        return len(blocks)
+    record('cache_load', measure(load, repeat=repeat))
+
+    blocks = db_cache.load_cache(datafile, cache_path)
+    blocks.index
+    export_path = os.path.join(workdir, 'export')
+
+    for pattern_wildcards, pattern in benchmark_patterns(blocks):
+        if pattern_wildcards not in wildcards:
+            continue
+
+        def searcher():
+            return lightning_searcher.LightningSearch(pattern, print_data=False, datafile=datafile, blocks=blocks)
+
+        def searched():
+            lightning_search = searcher()
+            lightning_search.generic_dataframe_search()
+            return lightning_search
+
+        def table():
+            return searched().generate_new_table()
+
+        def generic(lightning_search):
+            lightning_search.generic_dataframe_search()
+            return len(lightning_search.rows)
+
+        def advanced(lightning_search):
+            lightning_search.advanced_dataframe_search(filter_column, filter_regex)
+            return len(lightning_search.rows)
+
+        def export_csv(new_table):
+            lightning_searcher.LightningSearch.export_to_csv(new_table, export_path)
+            return len(new_table)
+
+        def export_json(new_table):
+            lightning_searcher.LightningSearch.export_to_json(new_table, export_path)
+            return len(new_table)
+
+        stages = [
+            ('generic_dataframe_search', generic, searcher),
+            ('advanced_dataframe_search', advanced, searched),
+            ('generate_new_table', lambda lightning_search: len(lightning_search.generate_new_table()), searched),
+            ('export_to_csv', export_csv, table),
+            ('export_to_json', export_json, table)
+        ]
+        for stage, run, setup in stages:
+            record(stage, measure(run, setup, repeat), pattern, pattern_wildcards)
+
+    if os.path.exists(export_path):
+        os.remove(export_path)
+    return results
+
+
+def imported_modules(command, cwd) -> set:
+    """Run a command under -X importtime
+
+    Args:
+        command (list): arguments for the python interpreter
+        cwd (str): directory to run in
+
+    Returns:
+        set: names of every module the command imported
+    """
+    output = subprocess.run([sys.executable, '-X', 'importtime'] + command, cwd=cwd,
+                            capture_output=True, text=True).stderr
+    return {line.rsplit('|', 1)[1].strip() for line in output.splitlines() if line.startswith('import time:')}
+
+
+def run_startup_benchmarks(datafile, workdir, pattern, number, repeat=3) -> list:
+    """Time the command line from process start to exit, and check what it imports
+
+    Args:
+        datafile (str): report to search
+        workdir (str): scratch directory, the command line runs in it
+        pattern (str): pattern to search for
+        number (str): full number to search for
+        repeat (int, optional): timed runs per command
+
+    Returns:
+        list: one result dict per entry of STARTUP_RUNS, with its budget and
+        whether pandas was imported
+    """
+    # The command line always reads ./phone_numbers.csv
+    local_datafile = os.path.join(workdir, 'phone_numbers.csv')
+    if os.path.abspath(datafile) != local_datafile:
+        os.symlink(os.path.abspath(datafile), local_datafile)
+    # Build the cache outside of the timed runs
+    db_cache.load_cache(local_datafile)
+
+    results = []
+    for stage, (arguments, budget, pandas_allowed) in STARTUP_RUNS.items():
+        placeholders = {'PATTERN' : pattern, 'NUMBER' : number}
+        command = [PHONEBRUTE] + [placeholders.get(argument, argument) for argument in arguments]
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            subprocess.run([sys.executable] + command, cwd=workdir, capture_output=True)
+            timings.append(time.perf_counter() - start)
+        pandas_imported = 'pandas' in imported_modules(command, workdir)
+
+        result = {
+            'stage' : stage,
+            'pattern' : next((placeholders[argument] for argument in arguments if argument in placeholders), None),
+            'wildcards' : None,
+            'seconds' : min(timings),
+            'median_seconds' : statistics.median(timings),
+            'peak_bytes' : None,
+            'rows' : None,
+            'budget_seconds' : budget,
+            'pandas' : pandas_imported,
+            'within_budget' : (budget is None or min(timings) <= budget) and (pandas_allowed or not pandas_imported)
+        }
+        results.append(result)
+        print(f"[PHONEBRUTE] {stage}: {result['seconds']:.4f}s{', imports pandas' if pandas_imported else ''}",
+              file=sys.stderr)
+    return results
+
+
+def compare(results, baseline) -> list:
+    """Line up results against an earlier results file
+
+    Args:
+        results (list): results of this run
+        baseline (list): results of the earlier run
+
+    Returns:
+        list: [stage, wildcards, baseline seconds, seconds, ratio] rows
+    """
+    previous = {(result['stage'], result['wildcards']): result for result in baseline}
+    rows = []
+    for result in results:
+        before = previous.get((result['stage'], result['wildcards']))
+        if before is None or before['seconds'] == 0:
+            continue
+        ratio = result['seconds'] / before['seconds']
+        rows.append([result['stage'], result['wildcards'], before['seconds'], result['seconds'], ratio])
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark phonebrute against a synthetic report')
+    parser.add_argument("--datafile", help="Benchmark against this report instead of a synthetic one")
+    parser.add_argument("--scale", type=float, default=1.0, help="Size of the synthetic report, relative to the real one")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for the synthetic report")
+    parser.add_argument("-w", "--wildcards", type=int, nargs='+', default=list(WILDCARDS), help="Pattern shapes to run, by number of wildcards")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="Timed runs per stage")
+    parser.add_argument("-o", "--output", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="Compare against an earlier results file")
+    parser.add_argument("--startup-only", default=False, action="store_true", help="Only time command line start up against its budget")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix='phonebrute-bench-') as workdir:
+        datafile = args.datafile
+        if datafile is None:
+            datafile = os.path.join(workdir, 'phone_numbers.csv')
+            blocks = synthetic_data.write_report(datafile, args.scale, args.seed)
+            print(f"[PHONEBRUTE] Generated {blocks} synthetic blocks", file=sys.stderr)
+        results = [] if args.startup_only else run_benchmarks(datafile, workdir, args.wildcards, args.repeat)
+        shapes = dict(benchmark_patterns(db_cache.load_cache(datafile, os.path.join(workdir, 'bench.cache'))))
+        results += run_startup_benchmarks(datafile, workdir, shapes[4], shapes[0], args.repeat)
+
+    report = {
+        'version' : RESULTS_VERSION,
+        'commit' : git_commit(),
+        'created' : time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python' : platform.python_version(),
+        'numpy' : np.__version__,
+        'pandas' : pd.__version__,
+        'machine' : platform.platform(),
+        'datafile' : args.datafile,
+        'scale' : None if args.datafile else args.scale,
+        'seed' : None if args.datafile else args.seed,
+        'repeat' : args.repeat,
+        'results' : results
+    }
+    if args.output:
+        with open(args.output, 'w') as outfile:
+            json.dump(report, outfile, indent=2)
+        print(f"[PHONEBRUTE] Wrote results to {args.output}", file=sys.stderr)
+
+    print(tabulate([[result['stage'], result['pattern'] or '', result['rows'], result['seconds'],
+                     None if result['peak_bytes'] is None else result['peak_bytes'] / 2 ** 20,
+                     result.get('budget_seconds')] for result in results],
+                   headers=['stage', 'pattern', 'rows', 'seconds', 'peak MiB', 'budget'], tablefmt='pipe',
+                   floatfmt='.4f', missingval=''))
+
+    over_budget = [result['stage'] for result in results if result.get('within_budget') is False]
+    if over_budget:
+        print(f"[PHONEBRUTE] Over the start up budget (or importing pandas when it shouldn't): {', '.join(over_budget)}")
+
+    if args.compare:
+        with open(args.compare) as infile:
+            rows = compare(results, json.load(infile)['results'])
+        print()
+        print(tabulate(rows, headers=['stage', 'wildcards', 'baseline', 'seconds', 'ratio'],
+                       tablefmt='pipe', floatfmt='.4f'))
+        regressions = [row for row in rows if row[4] > REGRESSION_RATIO]
+        if regressions:
+            print(f"[PHONEBRUTE] {len(regressions)} stages are more than {REGRESSION_RATIO}x slower than the baseline")
+            return 1
+    return 1 if over_budget else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
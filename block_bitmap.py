@@ -0,0 +1,147 @@
+# Block Bitmap
+# One bit per thousands block (NPA-NXX-X, 10^7 of them) for each of assigned,
+# contaminated and TN not available, so checking a number is a single gather
+import os
+import numpy as np
+import block_index
+
+# Planes of the bitmap, in file order, and the column value that sets a bit
+PLANES = ('assigned', 'contaminated', 'tn_not_available')
+PLANE_VALUES = {
+    'assigned' : ('status', 'AS'),
+    'contaminated' : ('contaminated', 'Y'),
+    'tn_not_available' : ('tn_not_available', 'Y')
+}
+
+# Every block a 10 digit number can be in, 1.25MB a plane once packed
+BLOCKS = 10 ** 7
+
+# Where the bitmap lives inside a cache directory
+FILE_NAME = 'bitmap.npy'
+
+
+def build_planes(columns, dictionaries) -> np.ndarray:
+    """Compile cache columns into bitmap planes
+
+    Args:
+        columns (dict): cache columns, sorted by (NPA, NXX, x)
+        dictionaries (dict): column name -> list of distinct values
+
+    Returns:
+        np.ndarray: uint8 array of shape (len(PLANES), BLOCKS // 8). Bit b
+        of a plane (byte b // 8, most significant bit first, as np.packbits
+        lays it out) is the block of the numbers starting with the 7 digits b.
+    """
+    exchange = columns['NPA'].astype(np.int32) * 1000 + columns['NXX']
+    block_rows = block_index.dense_block_rows(exchange, columns['x'])
+    listed = block_rows >= 0
+    rows = np.maximum(block_rows, 0)
+
+    planes = np.zeros((len(PLANES), BLOCKS // 8), dtype=np.uint8)
+    for i, plane in enumerate(PLANES):
+        column, value = PLANE_VALUES[plane]
+        if value not in dictionaries[column]:
+            continue
+        bits = listed & (columns[column][rows] == dictionaries[column].index(value))
+        planes[i] = np.packbits(bits)
+    return planes
+
+
+def write_planes(cache_path, columns, dictionaries):
+    """Compile and save the bitmap of a cache
+
+    Args:
+        cache_path (str): cache directory
+        columns (dict): cache columns
+        dictionaries (dict): column name -> list of distinct values
+    """
+    np.save(os.path.join(cache_path, FILE_NAME), build_planes(columns, dictionaries))
+
+
+def _number_blocks(numbers) -> tuple:
+    # (mask of the 10 digit numbers, block of every number, 0 for the others)
+    numbers = np.asarray(numbers, dtype=np.int64)
+    valid = (numbers >= 0) & (numbers < 10 ** 10)
+    return valid, np.where(valid, numbers, 0) // 1000
+
+
+class BlockBitmap:
+    """
+    Assigned, contaminated and TN not available bits of every block.
+    Opened from a cache it is memory-mapped, so loading it costs nothing
+    and only the pages a check touches are read.
+    """
+
+    def __init__(self, planes):
+        self.planes = planes
+
+    @classmethod
+    def open(cls, cache_path):
+        """Memory-map the bitmap of a cache directory
+
+        Args:
+            cache_path (str): cache directory
+
+        Returns:
+            BlockBitmap: the bitmap
+        """
+        return cls(np.load(os.path.join(cache_path, FILE_NAME), mmap_mode='r'))
+
+    @classmethod
+    def from_table(cls, blocks):
+        """Compile the bitmap of a table in memory
+
+        Args:
+            blocks (db_cache.BlockTable): the table
+
+        Returns:
+            BlockBitmap: the bitmap
+        """
+        return cls(build_planes(blocks.columns, blocks.dictionaries))
+
+    def _bits(self, plane, blocks) -> np.ndarray:
+        # Byte block // 8, most significant bit first
+        bytes_ = self.planes[PLANES.index(plane)][blocks >> 3]
+        return (bytes_ >> (7 - (blocks & 7)).astype(np.uint8)) & 1 == 1
+
+    def test(self, plane, numbers) -> np.ndarray:
+        """Look up one plane for many numbers
+
+        Args:
+            plane (str): plane name, see PLANES
+            numbers (np.ndarray): 10 digit phone numbers as integers, negative for none
+
+        Returns:
+            np.ndarray: bool mask, False for numbers that aren't 10 digits
+        """
+        valid, blocks = _number_blocks(numbers)
+        return valid & self._bits(plane, blocks)
+
+    def is_valid(self, numbers, include_contaminated=False) -> np.ndarray:
+        """Check which numbers are in an assigned block
+
+        Args:
+            numbers (np.ndarray): 10 digit phone numbers as integers, negative for none
+            include_contaminated (bool, optional): count contaminated blocks as valid
+
+        Returns:
+            np.ndarray: bool mask
+        """
+        valid, blocks = _number_blocks(numbers)
+        valid &= self._bits('assigned', blocks)
+        if not include_contaminated:
+            valid &= ~self._bits('contaminated', blocks)
+        return valid
+
+    def filter(self, numbers, include_contaminated=False) -> np.ndarray:
+        """Keep the valid numbers of a candidate list
+
+        Args:
+            numbers (np.ndarray): 10 digit phone numbers as integers
+            include_contaminated (bool, optional): keep numbers in contaminated blocks
+
+        Returns:
+            np.ndarray: the valid numbers, in their original order
+        """
+        numbers = np.asarray(numbers, dtype=np.int64)
+        return numbers[self.is_valid(numbers, include_contaminated)]
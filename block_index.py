@@ -0,0 +1,141 @@
+# Block Index
+# Range lookups over the (NPA, NXX, x) sorted block table
+import numpy as np
+
+# Above this many candidate exchanges, scanning the matching area codes is cheaper
+MAX_BISECT_EXCHANGES = 4096
+
+
+def ranges_to_rows(starts, stops) -> np.ndarray:
+    """Concatenate several [start, stop) ranges of row positions
+
+    Args:
+        starts (np.ndarray): range starts
+        stops (np.ndarray): range ends
+
+    Returns:
+        np.ndarray: row positions, in range order
+    """
+    lengths = stops - starts
+    total = int(lengths.sum())
+    if total == 0:
+        return np.empty(0, dtype=np.int64)
+    # Offset every position by where its range starts minus where it lands in the output
+    shifts = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+    return np.arange(total, dtype=np.int64) + shifts
+
+
+def dense_block_rows(exchange, x) -> np.ndarray:
+    """Map every thousands block to the row holding it
+
+    Args:
+        exchange (np.ndarray): NPA * 1000 + NXX of every row
+        x (np.ndarray): thousands digit of every row, -1 for a whole exchange
+
+    Returns:
+        np.ndarray: 10^7 int32 rows, indexed by the first 7 digits of a phone
+        number, -1 where no row holds the block
+    """
+    block_rows = np.full(10 ** 7, -1, dtype=np.int32)
+    rows = np.arange(len(exchange), dtype=np.int32)
+    whole = x < 0
+    # Rows covering a whole exchange fill its 10 blocks first, so rows for a
+    # single block win where both exist
+    starts = exchange[whole].astype(np.int64) * 10
+    block_rows[(starts[:, None] + np.arange(10)).ravel()] = np.repeat(rows[whole], 10)
+    block_rows[exchange[~whole].astype(np.int64) * 10 + x[~whole]] = rows[~whole]
+    return block_rows
+
+
+class BlockIndex:
+    """
+    Index over a BlockTable whose rows are sorted by (NPA, NXX, x).
+    Lookups cost time proportional to the blocks they return, not to
+    the size of the table.
+    """
+
+    def __init__(self, blocks):
+        self.blocks = blocks
+        self.npa = np.asarray(blocks.columns['NPA'])
+        self.nxx = np.asarray(blocks.columns['NXX'])
+        self.x = np.asarray(blocks.columns['x'])
+        # NPA * 1000 + NXX, ascending
+        self.exchange = self.npa.astype(np.int32) * 1000 + self.nxx
+        # Rows of NPA n live in npa_offsets[n]:npa_offsets[n + 1]
+        self.npa_offsets = np.searchsorted(self.exchange, np.arange(1001) * 1000)
+        self._block_rows = None
+
+    def exchange_rows(self, exchanges) -> np.ndarray:
+        """Get the rows of some exact exchanges
+
+        Args:
+            exchanges (np.ndarray): NPA * 1000 + NXX values, ascending
+
+        Returns:
+            np.ndarray: row positions
+        """
+        starts = np.searchsorted(self.exchange, exchanges, side='left')
+        stops = np.searchsorted(self.exchange, exchanges, side='right')
+        return ranges_to_rows(starts, stops)
+
+    @property
+    def block_rows(self) -> np.ndarray:
+        """
+        Row of every thousands block, indexed by the first 7 digits of a phone
+        number, -1 where no block holds it. 10^7 int32 (40MB), built on first use.
+        """
+        if self._block_rows is None:
+            self._block_rows = dense_block_rows(self.exchange, self.x)
+        return self._block_rows
+
+    def number_rows(self, numbers) -> np.ndarray:
+        """Find the block row holding each of some full phone numbers
+
+        Args:
+            numbers (np.ndarray): 10 digit phone numbers as integers, in any
+            order, negative for none
+
+        Returns:
+            np.ndarray: row position of every number, -1 where no block holds it
+        """
+        numbers = np.asarray(numbers, dtype=np.int64)
+        valid = (numbers >= 0) & (numbers < 10 ** 10)
+        rows = self.block_rows[np.where(valid, numbers, 0) // 1000].astype(np.int64)
+        rows[~valid] = -1
+        return rows
+
+    def lookup(self, automaton) -> np.ndarray:
+        """Find the rows whose blocks a pattern can match
+
+        NPAs, then exchanges, then thousands digits the automaton can't
+        match are pruned before any row is touched.
+
+        Args:
+            automaton (patterns.DigitAutomaton): compiled 10 digit pattern
+
+        Returns:
+            np.ndarray: ascending row positions into the BlockTable
+        """
+        npa_values = np.flatnonzero(automaton.walk(np.arange(1000), 3) >= 0)
+        # Skip area codes that have no blocks at all
+        npa_values = npa_values[self.npa_offsets[npa_values + 1] > self.npa_offsets[npa_values]]
+        # Every exchange of the remaining area codes, with the state it leaves the automaton in
+        exchanges = (npa_values[:, None] * 1000 + np.arange(1000)).ravel()
+        exchange_states = automaton.walk(exchanges, 6)
+        exchanges = exchanges[exchange_states >= 0]
+
+        if len(exchanges) <= MAX_BISECT_EXCHANGES:
+            # Few candidate exchanges: bisect for each one
+            rows = self.exchange_rows(exchanges)
+        else:
+            # Take the matching area codes whole and keep the wanted exchanges
+            rows = ranges_to_rows(self.npa_offsets[npa_values], self.npa_offsets[npa_values + 1])
+            npa_positions = np.searchsorted(npa_values, self.npa[rows])
+            rows = rows[exchange_states[npa_positions * 1000 + self.nxx[rows]] >= 0]
+
+        # Thousands digits each exchange state can go on with; x == -1 (no
+        # thousands digit) picks the trailing True
+        block_digits = automaton.transitions[6] >= 0
+        allowed = np.append(block_digits, np.ones((len(block_digits), 1), dtype=bool), axis=1)
+        states = automaton.walk(self.exchange[rows], 6)
+        return rows[allowed[states, self.x[rows]]]
@@ -0,0 +1,89 @@
+# Query Client
+# Talk to a running phonebrute server, using nothing but the standard library
+import os
+import json
+import socket
+import urllib.parse
+import http.client
+
+DEFAULT_URL = 'http://127.0.0.1:8642'
+
+# Seconds to wait when checking whether a server is up
+PROBE_TIMEOUT = 0.2
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """
+    HTTPConnection over a Unix socket, for unix:///path/to/socket URLs
+    """
+
+    def __init__(self, path, timeout=None):
+        super().__init__('localhost', timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+
+class ServerError(Exception):
+    """
+    The server answered, but with an error
+    """
+
+
+def _connect(url, timeout=None):
+    parts = urllib.parse.urlsplit(url)
+    if parts.scheme == 'unix':
+        return UnixHTTPConnection(parts.path, timeout=timeout)
+    return http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=timeout)
+
+
+def find_server(url=None):
+    """Find a running server
+
+    Args:
+        url (str, optional): server to check. Defaults to $PHONEBRUTE_SERVER,
+        then to DEFAULT_URL.
+
+    Returns:
+        str: the url of the server, or None if nothing answered
+    """
+    url = url or os.environ.get('PHONEBRUTE_SERVER') or DEFAULT_URL
+    try:
+        connection = _connect(url, timeout=PROBE_TIMEOUT)
+        connection.request('GET', '/health')
+        healthy = connection.getresponse().status == 200
+        connection.close()
+    except OSError:
+        return None
+    return url if healthy else None
+
+
+def request(url, path, params):
+    """Send a GET request to the server
+
+    Args:
+        url (str): server url
+        path (str): endpoint ex: /search
+        params (dict): query parameters, lists are sent as repeated parameters
+
+    Raises:
+        ServerError: if the server rejected the request
+
+    Returns:
+        http.client.HTTPResponse: the response, to be read as a stream
+    """
+    connection = _connect(url)
+    connection.request('GET', f"{path}?{urllib.parse.urlencode(params, doseq=True)}")
+    response = connection.getresponse()
+    if response.status != 200:
+        body = response.read().decode('utf-8', 'replace')
+        try:
+            body = json.loads(body)['error']
+        except (ValueError, KeyError, TypeError):
+            pass
+        raise ServerError(body)
+    return response
@@ -0,0 +1,495 @@
+# NPA-NXX Block Cache
+# Compact, memory-mappable columnar copy of phone_numbers.csv
+import os
+import sys
+import json
+import shutil
+import numpy as np
+
+CACHE_VERSION = 2
+
+# Column names used everywhere else in phonebrute, in file order
+COLUMN_NAMES = ['region','state','NPA','NXX','x','status','code_holder',
+                'contaminated','tn_not_available','rate_center','block_effective_date',
+                'block_available_date','carrier','ocn','date_assigned']
+
+# Numeric columns are stored as small integers, everything else is dictionary-encoded
+INTEGER_COLUMNS = {
+    'NPA' : np.int16,
+    'NXX' : np.int16,
+    'x' : np.int8
+}
+TEXT_COLUMNS = [column for column in COLUMN_NAMES if column not in INTEGER_COLUMNS]
+
+# An update shrinking the report below this fraction of its blocks is refused
+MIN_UPDATE_RATIO = 0.5
+
+# Lookup tables used to turn the integer columns back into the strings the CSV had
+_PADDED_3 = np.array([f"{i:03d}" for i in range(1000)], dtype=object)
+# x == -1 (a block without a thousands digit) indexes the trailing None
+_BLOCK_DIGITS = np.array([str(i) for i in range(10)] + [None], dtype=object)
+
+
+def cache_path_for(datafile):
+    """Get the default cache location for a datafile
+
+    Args:
+        datafile (str): path to phone_numbers.csv
+
+    Returns:
+        str: path of the cache directory
+    """
+    return datafile + '.cache'
+
+
+def source_signature(datafile):
+    """Describe the datafile well enough to notice when it changes
+
+    Args:
+        datafile (str): path to phone_numbers.csv
+
+    Returns:
+        dict: size and modification time of the file
+    """
+    stat = os.stat(datafile)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def _code_dtype(dictionary_size):
+    if dictionary_size < np.iinfo(np.int16).max:
+        return np.int16
+    return np.int32
+
+
+def encode_frame(frame, base_dictionaries=None):
+    """Convert a dataframe read from the report into cache columns,
+    sorted by (NPA, NXX, x)
+
+    Args:
+        frame (pd.DataFrame): report with COLUMN_NAMES as columns, all str
+        base_dictionaries (dict, optional): dictionaries of an existing cache.
+        Values already in them keep their codes, new values are appended.
+
+    Returns:
+        tuple: (dict of column name -> np.ndarray, dict of column name -> list)
+    """
+    import pandas as pd
+
+    # The report ships with a header row, and sometimes junk at the end
+    npa = pd.to_numeric(frame['NPA'], errors='coerce')
+    nxx = pd.to_numeric(frame['NXX'], errors='coerce')
+    valid = (npa.notna() & nxx.notna()).to_numpy()
+    frame = frame[valid]
+
+    columns = {
+        'NPA' : npa[valid].to_numpy(dtype=np.int16),
+        'NXX' : nxx[valid].to_numpy(dtype=np.int16),
+        'x' : pd.to_numeric(frame['x'], errors='coerce').fillna(-1).to_numpy(dtype=np.int8)
+    }
+    dictionaries = {}
+    for column in TEXT_COLUMNS:
+        if base_dictionaries is None:
+            # Sorted dictionaries keep the codes stable between rebuilds of the same file
+            codes, uniques = pd.factorize(frame[column], sort=True)
+            dictionary = [str(value) for value in uniques]
+        else:
+            known = base_dictionaries[column]
+            dictionary = known + sorted(set(frame[column].dropna().unique()) - set(known))
+            codes = pd.Categorical(frame[column], categories=dictionary).codes
+        columns[column] = codes.astype(_code_dtype(len(dictionary)))
+        dictionaries[column] = dictionary
+
+    # Keep the rows sorted by (NPA, NXX, x) so BlockIndex can bisect them
+    order = np.lexsort((columns['x'], columns['NXX'], columns['NPA']))
+    columns = {column: values[order] for column, values in columns.items()}
+    return columns, dictionaries
+
+
+def previous_path_for(cache_path):
+    """Get where the snapshot replaced by the last write is kept
+
+    Args:
+        cache_path (str): cache directory
+
+    Returns:
+        str: path of the previous snapshot
+    """
+    return cache_path + '.prev'
+
+
+def write_cache(cache_path, columns, dictionaries, source, remote=None):
+    """Write the cache to disk, replacing any existing cache atomically.
+    The replaced cache is kept as the previous snapshot for rollback_cache.
+
+    Args:
+        cache_path (str): cache directory
+        columns (dict): column name -> np.ndarray
+        dictionaries (dict): column name -> list of distinct values
+        source (dict): signature of the file the cache was built from
+        remote (dict, optional): url, etag and last_modified of the download
+    """
+    temp_path = cache_path + '.tmp'
+    if os.path.exists(temp_path):
+        shutil.rmtree(temp_path)
+    os.makedirs(temp_path)
+
+    for column in COLUMN_NAMES:
+        np.save(os.path.join(temp_path, f"{column}.npy"), columns[column])
+    import block_bitmap
+    block_bitmap.write_planes(temp_path, columns, dictionaries)
+
+    meta = {
+        'version' : CACHE_VERSION,
+        'rows' : int(len(columns['NPA'])),
+        'source' : source,
+        'remote' : remote,
+        'dictionaries' : dictionaries
+    }
+    with open(os.path.join(temp_path, 'meta.json'), 'w', encoding='utf-8') as metafile:
+        json.dump(meta, metafile)
+
+    previous_path = previous_path_for(cache_path)
+    if os.path.exists(cache_path):
+        if os.path.exists(previous_path):
+            shutil.rmtree(previous_path)
+        os.replace(cache_path, previous_path)
+    os.replace(temp_path, cache_path)
+
+
+def write_meta(cache_path, meta):
+    """Replace the metadata of a cache without touching its columns
+
+    Args:
+        cache_path (str): cache directory
+        meta (dict): new metadata
+    """
+    temp_file = os.path.join(cache_path, 'meta.json.tmp')
+    with open(temp_file, 'w', encoding='utf-8') as metafile:
+        json.dump(meta, metafile)
+    os.replace(temp_file, os.path.join(cache_path, 'meta.json'))
+
+
+def rollback_cache(cache_path):
+    """Swap the cache with its previous snapshot. Rolling back twice
+    restores the newer snapshot.
+
+    Args:
+        cache_path (str): cache directory
+
+    Raises:
+        FileNotFoundError: if there is no previous snapshot
+    """
+    previous_path = previous_path_for(cache_path)
+    if read_meta(previous_path) is None:
+        raise FileNotFoundError(f"No previous snapshot found at {previous_path}")
+    swap_path = cache_path + '.swap'
+    os.replace(cache_path, swap_path)
+    os.replace(previous_path, cache_path)
+    os.replace(swap_path, previous_path)
+
+
+def read_meta(cache_path):
+    """Read the metadata of a cache
+
+    Args:
+        cache_path (str): cache directory
+
+    Returns:
+        dict: the metadata, or None if there is no usable cache
+    """
+    try:
+        with open(os.path.join(cache_path, 'meta.json'), 'r', encoding='utf-8') as metafile:
+            return json.load(metafile)
+    except (OSError, ValueError):
+        return None
+
+
+def build_cache(datafile, cache_path=None):
+    """Parse the CSV once and store it as a cache
+
+    Args:
+        datafile (str): path to phone_numbers.csv
+        cache_path (str, optional): cache directory. Defaults to datafile + '.cache'.
+
+    Returns:
+        BlockTable: the freshly built table
+    """
+    import pandas as pd
+
+    cache_path = cache_path or cache_path_for(datafile)
+    source = source_signature(datafile)
+    frame = pd.read_csv(datafile, names=COLUMN_NAMES, na_values='NONE', dtype=str)
+    columns, dictionaries = encode_frame(frame)
+    write_cache(cache_path, columns, dictionaries, source)
+    return BlockTable.open(cache_path)
+
+
+def load_cache(datafile, cache_path=None):
+    """Open the cache for a datafile, rebuilding it if the datafile changed
+
+    Args:
+        datafile (str): path to phone_numbers.csv
+        cache_path (str, optional): cache directory. Defaults to datafile + '.cache'.
+
+    Returns:
+        BlockTable: the table
+    """
+    cache_path = cache_path or cache_path_for(datafile)
+    meta = read_meta(cache_path)
+
+    if meta is None or meta.get('version') != CACHE_VERSION:
+        return build_cache(datafile, cache_path)
+    # Without the CSV the cache is all we have, so trust it
+    if os.path.exists(datafile) and source_signature(datafile) != meta.get('source'):
+        return build_cache(datafile, cache_path)
+    return BlockTable.open(cache_path, meta)
+
+
+def block_keys(columns) -> np.ndarray:
+    """Get a unique integer key for every block
+
+    Args:
+        columns (dict): cache columns, sorted by (NPA, NXX, x)
+
+    Returns:
+        np.ndarray: ascending keys
+    """
+    exchanges = columns['NPA'].astype(np.int64) * 1000 + columns['NXX']
+    # x ranges over -1..9, so 11 slots per exchange
+    return exchanges * 11 + columns['x'] + 1
+
+
+def validate_columns(columns, previous_rows=None):
+    """Check that freshly parsed report columns look like a real report
+
+    Args:
+        columns (dict): cache columns
+        previous_rows (int, optional): blocks in the cache being replaced
+
+    Raises:
+        ValueError: if the report is empty, malformed or much smaller than before
+    """
+    rows = len(columns['NPA'])
+    if rows == 0:
+        raise ValueError("The new report contains no blocks")
+    if columns['NPA'].min() < 200 or columns['NPA'].max() > 999:
+        raise ValueError("The new report contains NPAs outside 200-999")
+    if columns['NXX'].min() < 0 or columns['NXX'].max() > 999:
+        raise ValueError("The new report contains NXXs outside 000-999")
+    if previous_rows and rows < previous_rows * MIN_UPDATE_RATIO:
+        raise ValueError(f"The new report has {rows} blocks, down from {previous_rows}")
+
+
+def diff_columns(previous, columns) -> dict:
+    """Count how the blocks of two caches differ
+
+    Args:
+        previous (BlockTable): the existing cache
+        columns (dict): new cache columns, encoded with previous's dictionaries
+
+    Returns:
+        dict: numbers of added, removed, changed and unchanged blocks
+    """
+    old_keys = block_keys(previous.columns)
+    new_keys = block_keys(columns)
+    added = ~np.isin(new_keys, old_keys)
+    removed = ~np.isin(old_keys, new_keys)
+
+    # Line up the blocks present in both and compare every column
+    new_rows = np.flatnonzero(~added)
+    old_rows = np.searchsorted(old_keys, new_keys[new_rows])
+    changed = np.zeros(len(new_rows), dtype=bool)
+    for column in COLUMN_NAMES:
+        changed |= previous.columns[column][old_rows] != columns[column][new_rows]
+
+    return {
+        'added' : int(added.sum()),
+        'removed' : int(removed.sum()),
+        'changed' : int(changed.sum()),
+        'unchanged' : int(len(changed) - changed.sum())
+    }
+
+
+def update_cache(report, cache_path, remote=None, force=False, source=None) -> dict:
+    """Bring a cache up to date with a new copy of the report
+
+    The new report is validated and diffed against the existing cache,
+    reusing its dictionary codes. If no block changed only the metadata
+    is rewritten; otherwise the new snapshot replaces the cache and the
+    old one is kept for rollback_cache.
+
+    Args:
+        report (file): the report, as a CSV stream
+        cache_path (str): cache directory
+        remote (dict, optional): url, etag and last_modified of the download
+        force (bool, optional): accept a report much smaller than the current one
+        source (dict, optional): signature of the datafile the cache belongs
+        to, if there is one. It is stored with the update so load_cache
+        doesn't rebuild over it from the older CSV.
+
+    Raises:
+        ValueError: if the new report fails validation; the cache is left alone
+
+    Returns:
+        dict: numbers of added, removed, changed and unchanged blocks
+    """
+    import pandas as pd
+
+    meta = read_meta(cache_path)
+    previous = None
+    if meta is not None and meta.get('version') == CACHE_VERSION:
+        previous = BlockTable.open(cache_path, meta)
+
+    frame = pd.read_csv(report, names=COLUMN_NAMES, na_values='NONE', dtype=str)
+    columns, dictionaries = encode_frame(frame, previous.dictionaries if previous else None)
+    validate_columns(columns, None if previous is None or force else len(previous))
+
+    if previous is None:
+        write_cache(cache_path, columns, dictionaries, source, remote)
+        return {'added': len(columns['NPA']), 'removed': 0, 'changed': 0, 'unchanged': 0}
+
+    source = source if source is not None else meta.get('source')
+    changes = diff_columns(previous, columns)
+    if changes['added'] == changes['removed'] == changes['changed'] == 0:
+        write_meta(cache_path, dict(meta, source=source, remote=remote))
+    else:
+        write_cache(cache_path, columns, dictionaries, source, remote)
+    return changes
+
+
+class BlockTable:
+    """
+    Read-only view of the cached report. Integer columns are numpy
+    arrays, text columns are integer codes into a per-column dictionary
+    (-1 marks a missing value).
+    """
+
+    def __init__(self, columns, dictionaries, path=None):
+        self.columns = columns
+        self.dictionaries = dictionaries
+        self.path = path
+        self._decoders = {}
+        self._index = None
+        self._bitmap = None
+
+    @classmethod
+    def open(cls, cache_path, meta=None):
+        """Memory-map a cache directory
+
+        Args:
+            cache_path (str): cache directory
+            meta (dict, optional): already loaded metadata
+
+        Returns:
+            BlockTable: the table
+        """
+        meta = meta or read_meta(cache_path)
+        if meta is None:
+            raise FileNotFoundError(f"No phonebrute cache found at {cache_path}")
+        columns = {column: np.load(os.path.join(cache_path, f"{column}.npy"), mmap_mode='r')
+                   for column in COLUMN_NAMES}
+        return cls(columns, meta['dictionaries'], cache_path)
+
+    def __len__(self):
+        return len(self.columns['NPA'])
+
+    @property
+    def index(self):
+        """
+        Sorted (NPA, NXX, x) index over the table, built on first use
+        """
+        if self._index is None:
+            import block_index
+            self._index = block_index.BlockIndex(self)
+        return self._index
+
+    @property
+    def bitmap(self):
+        """
+        Assigned, contaminated and TN not available bits of every block,
+        memory-mapped from the cache (or compiled on first use for caches
+        written without one)
+        """
+        if self._bitmap is None:
+            import block_bitmap
+            if self.path is not None and os.path.exists(os.path.join(self.path, block_bitmap.FILE_NAME)):
+                self._bitmap = block_bitmap.BlockBitmap.open(self.path)
+            else:
+                self._bitmap = block_bitmap.BlockBitmap.from_table(self)
+        return self._bitmap
+
+    def decoder(self, column):
+        """Get an object array mapping stored values to strings for a column
+
+        Args:
+            column (str): column name
+
+        Returns:
+            np.ndarray: strings indexed by the stored value; the last entry is None
+            so that a stored -1 (missing) decodes to None
+        """
+        if column == 'x':
+            return _BLOCK_DIGITS
+        if column in INTEGER_COLUMNS:
+            return _PADDED_3
+        if column not in self._decoders:
+            self._decoders[column] = np.array(self.dictionaries[column] + [None], dtype=object)
+        return self._decoders[column]
+
+    def code_of(self, column, value):
+        """Get the stored code of a value in a text column
+
+        Args:
+            column (str): text column
+            value (str): value to look up
+
+        Returns:
+            int: the code, or None if the value never occurs
+        """
+        try:
+            return self.dictionaries[column].index(value)
+        except ValueError:
+            return None
+
+    def decode(self, column, rows=None):
+        """Get a column as the strings the CSV had
+
+        Args:
+            column (str): column name
+            rows (np.ndarray, optional): row positions to take. Defaults to all rows.
+
+        Returns:
+            np.ndarray: object array of strings (None where the CSV said NONE)
+        """
+        values = self.columns[column]
+        if rows is not None:
+            values = values[rows]
+        return self.decoder(column)[values]
+
+    def to_dataframe(self, rows=None):
+        """Materialize (part of) the table as a dataframe
+
+        Args:
+            rows (np.ndarray, optional): row positions to take. Defaults to all rows.
+
+        Returns:
+            pd.DataFrame: dataframe with COLUMN_NAMES as columns, text columns categorical
+        """
+        import pandas as pd
+
+        data = {}
+        for column in COLUMN_NAMES:
+            if column in INTEGER_COLUMNS:
+                data[column] = self.decode(column, rows)
+            else:
+                codes = self.columns[column]
+                codes = codes[rows] if rows is not None else np.asarray(codes)
+                data[column] = pd.Categorical.from_codes(codes, categories=self.dictionaries[column])
+        return pd.DataFrame(data)
+
+
+if __name__ == '__main__':
+    # One-time conversion: python db_cache.py [phone_numbers.csv]
+    csv_file = sys.argv[1] if len(sys.argv) > 1 else 'phone_numbers.csv'
+    table = build_cache(csv_file)
+    print(f"Cached {len(table)} blocks to {table.path}")
@@ -1,18 +1,102 @@
 # Download the database from the server if it doesn't already exist
-from tqdm import tqdm
 import os
 import zipfile
+import tempfile
+import urllib.error
 import urllib.request
+import db_cache
 
 URL = 'https://nationalpooling.com/reports/region/AllBlocksAugmentedReport.zip'
 
 def download_and_extract(file_name, url=URL):
-    if not os.path.exists(file_name):
+    # A cache without the CSV (see update_database) is enough to search
+    has_cache = db_cache.read_meta(db_cache.cache_path_for(file_name)) is not None
+    if not os.path.exists(file_name) and not has_cache:
+        from tqdm import tqdm
         with tqdm(unit='B', unit_scale=True, unit_divisor=1024, miniters=1, desc=file_name) as t:
             urllib.request.urlretrieve(url, 'AllBlocksAugmentedReport.zip', reporthook=lambda count, block_size, total_size: t.update((block_size*count)))
         with zipfile.ZipFile('AllBlocksAugmentedReport.zip', 'r') as zip_ref:
             zip_ref.extractall()
         os.remove('AllBlocksAugmentedReport.zip')
         os.rename('AllBlocksAugmentedReport.txt', 'phone_numbers.csv')
+        # Convert it once now so the first search doesn't have to
+        db_cache.build_cache('phone_numbers.csv')
     else:
-        pass
\ No newline at end of file
+        pass
+
+def report_member(zip_ref):
+    """Find the report inside the downloaded archive
+
+    Args:
+        zip_ref (zipfile.ZipFile): the archive
+
+    Returns:
+        str: name of the report file
+    """
+    for name in zip_ref.namelist():
+        if name.lower().endswith(('.txt', '.csv')):
+            return name
+    raise ValueError("The downloaded archive does not contain a report")
+
+def update_database(file_name='phone_numbers.csv', url=URL, force=False):
+    """Refresh the cache from the server, if the report changed
+
+    The request is conditional on the ETag/Last-Modified of the last
+    update. The report is read straight out of the archive into the
+    cache without being extracted, and only replaces the cache if it
+    passes validation and differs from it.
+
+    Args:
+        file_name (str, optional): the datafile the cache belongs to
+        url (str, optional): where to download the report from
+        force (bool, optional): accept a report much smaller than the current one
+
+    Returns:
+        dict: numbers of added, removed, changed and unchanged blocks,
+        or None if the server reported no change
+    """
+    cache_path = db_cache.cache_path_for(file_name)
+    remote = (db_cache.read_meta(cache_path) or {}).get('remote') or {}
+
+    request = urllib.request.Request(url)
+    if remote.get('url') == url:
+        if remote.get('etag'):
+            request.add_header('If-None-Match', remote['etag'])
+        if remote.get('last_modified'):
+            request.add_header('If-Modified-Since', remote['last_modified'])
+    try:
+        response = urllib.request.urlopen(request)
+    except urllib.error.HTTPError as error:
+        if error.code == 304:
+            return None
+        raise
+
+    from tqdm import tqdm
+
+    # Zip archives have to be seekable, so spool the download to a temporary file
+    with response, tempfile.TemporaryFile() as archive:
+        total = int(response.headers.get('Content-Length') or 0) or None
+        with tqdm(total=total, unit='B', unit_scale=True, unit_divisor=1024, miniters=1, desc=url.split('/')[-1]) as t:
+            for chunk in iter(lambda: response.read(1024 * 1024), b''):
+                archive.write(chunk)
+                t.update(len(chunk))
+        archive.seek(0)
+
+        remote = {
+            'url' : url,
+            'etag' : response.headers.get('ETag'),
+            'last_modified' : response.headers.get('Last-Modified')
+        }
+        with zipfile.ZipFile(archive) as zip_ref:
+            with zip_ref.open(report_member(zip_ref)) as report:
+                # The CSV on disk stays as it is, so tie the update to it
+                source = db_cache.source_signature(file_name) if os.path.exists(file_name) else None
+                return db_cache.update_cache(report, cache_path, remote, force, source)
+
+def rollback_database(file_name='phone_numbers.csv'):
+    """Go back to the cache as it was before the last update
+
+    Args:
+        file_name (str, optional): the datafile the cache belongs to
+    """
+    db_cache.rollback_cache(db_cache.cache_path_for(file_name))
@@ -0,0 +1,145 @@
+# Column Filters
+# Evaluate filters once per distinct value, then apply them as code masks
+import re
+import numpy as np
+
+MODES = ('regex', 'exact', 'prefix')
+
+# Leading character that negates a filter given on the command line
+NEGATION = '!'
+
+# Command line option (and server parameter) -> column it filters
+OPTION_COLUMNS = {
+    'ratecenter' : 'rate_center',
+    'carrier' : 'carrier',
+    'state' : 'state'
+}
+
+
+class ColumnFilter:
+    """
+    A condition on one column of the block table. Matching is case
+    sensitive, and missing values never match (so they always pass a
+    negated filter).
+    """
+
+    def __init__(self, column, value, mode='regex', negate=False):
+        """
+        Args:
+            column (str): column to filter ex: carrier
+            value (str): regex, exact value or prefix, depending on mode
+            mode (str, optional): regex (search anywhere), exact or prefix
+            negate (bool, optional): keep the rows that don't match instead
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown match mode {mode}, use one of {', '.join(MODES)}")
+        self.column = column
+        self.value = value
+        self.mode = mode
+        self.negate = negate
+        self._pattern = None
+        if mode == 'regex':
+            try:
+                self._pattern = re.compile(value)
+            except re.error as error:
+                raise ValueError(f"Invalid regex {value!r} for {column}: {error}") from error
+
+    @classmethod
+    def parse(cls, column, text, mode='regex'):
+        """Build a filter from command line text, where a leading ! negates it
+
+        Args:
+            column (str): column to filter
+            text (str): ex: VERIZON or !VERIZON
+            mode (str, optional): regex, exact or prefix
+
+        Returns:
+            ColumnFilter: the filter
+        """
+        if text.startswith(NEGATION):
+            return cls(column, text[len(NEGATION):], mode, negate=True)
+        return cls(column, text, mode)
+
+    def __repr__(self):
+        negation = NEGATION if self.negate else ''
+        return f"ColumnFilter({self.column}, {negation}{self.value!r}, {self.mode})"
+
+    def matches(self, value) -> bool:
+        """Check a single value of the column
+
+        Args:
+            value (str): value, None if missing
+
+        Returns:
+            bool: whether the value matches, before negation
+        """
+        if value is None:
+            return False
+        if self.mode == 'exact':
+            return value == self.value
+        if self.mode == 'prefix':
+            return value.startswith(self.value)
+        return self._pattern.search(value) is not None
+
+    def value_mask(self, blocks) -> np.ndarray:
+        """Evaluate the filter once for every distinct value of the column
+
+        Args:
+            blocks (db_cache.BlockTable): the table
+
+        Returns:
+            np.ndarray: booleans indexed by stored code, like blocks.decoder(column)
+        """
+        mask = np.fromiter((self.matches(value) for value in blocks.decoder(self.column)), dtype=bool)
+        return ~mask if self.negate else mask
+
+
+def from_options(options, mode='regex') -> list:
+    """Build filters from command line options or server parameters
+
+    Args:
+        options (dict): option name (see OPTION_COLUMNS) -> list of texts,
+        "ALL" and missing options are ignored
+        mode (str, optional): regex, exact or prefix
+
+    Returns:
+        list: ColumnFilter objects
+    """
+    return [ColumnFilter.parse(column, text, mode)
+            for option, column in OPTION_COLUMNS.items()
+            for text in options.get(option) or [] if text != 'ALL']
+
+
+def apply_filters(blocks, rows, filters) -> np.ndarray:
+    """Keep the rows that pass the filters
+
+    On a column, a row passes when it matches any of the positive filters
+    (there are none, or -s MD -s NY would never match) and none of the
+    negated ones. Columns are combined with and. Filters on the same column
+    are merged into one value mask first, so every column is gathered only
+    once.
+
+    Args:
+        blocks (db_cache.BlockTable): the table
+        rows (np.ndarray): row positions into blocks
+        filters (list): ColumnFilter objects
+
+    Returns:
+        np.ndarray: the rows that pass
+    """
+    # column -> (any positive filter matches or None, no negated filter matches)
+    value_masks = {}
+    for column_filter in filters:
+        mask = column_filter.value_mask(blocks)
+        wanted, allowed = value_masks.get(column_filter.column, (None, np.ones_like(mask)))
+        if column_filter.negate:
+            allowed = allowed & mask
+        else:
+            wanted = mask if wanted is None else wanted | mask
+        value_masks[column_filter.column] = (wanted, allowed)
+
+    keep = np.ones(len(rows), dtype=bool)
+    for column, (wanted, allowed) in value_masks.items():
+        mask = allowed if wanted is None else wanted & allowed
+        keep &= mask[blocks.columns[column][rows]]
+    return rows[keep]
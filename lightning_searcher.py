@@ -1,74 +1,299 @@
 # Lightning Search
 # ef1500
+import os
+import sys
 import warnings
-import pandas as pd
-import itertools
-import math
-import json
-from tabulate import tabulate
+import numpy as np
+import db_cache
+import block_index
+import filters
+import patterns
+import profiler as stage_profiler
+import ranking
+import streaming
 
 warnings.simplefilter(action='ignore', category=FutureWarning)
 
+# Columns of the generated table
+TABLE_HEADERS = ["Phone Number", "state", "NXX", "contaminated", "rate_center",
+                 "block_effective_date", "carrier", "date_assigned"]
+
+# Use Seperate Headers so the table output looks nice
+DISPLAY_HEADERS = ["Phone Number", "State", "NXX", "Contaminated", "Rate Center",
+                   "Block Effective Date", "Carrier", "Date Assigned"]
+
+# Columns count_results breaks the count down by
+COUNT_COLUMNS = ('state', 'carrier', 'rate_center')
+
+# Columns of summarize_exchanges
+SUMMARY_HEADERS = ["Exchange", "State", "Rate Center", "Carrier", "Blocks", "Numbers"]
+
+# Rows printed per tabulate call, so printing never builds one giant string
+PAGE_SIZE = 1000
+
+# Bigger results are printed as a summary per exchange, unless asked for rows
+SUMMARY_THRESHOLD = 10000
+
+
+# Code points of every 4 and 3 digit string, for building numbers without str()
+_DIGIT_CHARS_4 = (np.arange(10000)[:, None] // 10**np.arange(3, -1, -1) % 10 + ord('0')).astype(np.uint32)
+_DIGIT_CHARS_3 = _DIGIT_CHARS_4[:1000, 1:].copy()
+
+
+def format_numbers(numbers) -> np.ndarray:
+    """Format integer phone numbers as zero-padded 10 digit strings
+
+    Args:
+        numbers (np.ndarray): phone numbers as integers
+
+    Returns:
+        np.ndarray: unicode array of 10 digit strings
+    """
+    exchanges, lines = np.divmod(np.asarray(numbers, dtype=np.int64), 10000)
+    npas, nxxs = np.divmod(exchanges, 1000)
+    # Lay the code points out as UCS4 and reinterpret them as strings
+    chars = np.empty((len(lines), 10), dtype=np.uint32)
+    chars[:, 0:3] = _DIGIT_CHARS_3[npas]
+    chars[:, 3:6] = _DIGIT_CHARS_3[nxxs]
+    chars[:, 6:10] = _DIGIT_CHARS_4[lines]
+    return chars.view('U10').ravel()
+
+
+def _cell(value) -> str:
+    # Missing values, None or NaN from pandas, print blank
+    if value is None or value != value:
+        return ''
+    return str(value)
+
+
+def column_widths(rows, columns) -> list:
+    """Measure the widest cell of every column
+
+    Args:
+        rows (list): lists of cells
+        columns (int): number of columns
+
+    Returns:
+        list: width of every column, 0 for empty ones
+    """
+    widths = [0] * columns
+    for row in rows:
+        widths = [max(width, len(_cell(value))) for width, value in zip(widths, row)]
+    return widths
+
+
+def _pipe_row(cells, widths, right) -> str:
+    padded = (cell.rjust(width) if align else cell.ljust(width)
+              for cell, width, align in zip(cells, widths, right))
+    return '| ' + ' | '.join(padded) + ' |'
+
+
+def search(input_number, include_contaminated=False, filters=None, print_data=False,
+           datafile='./phone_numbers.csv', blocks=None, profiler=None):
+    """Run a complete search: match the pattern, then apply the filters
+
+    Args:
+        input_number (str): 10 digit pattern ex: 312555XXXX
+        include_contaminated (bool, optional): include contaminated blocks
+        filters (list, optional): filters.ColumnFilter objects, applied in one pass
+        print_data (bool, optional): print the table when it is generated
+        datafile (str, optional): path to phone_numbers.csv
+        blocks (db_cache.BlockTable, optional): already loaded table to search
+        profiler (profiler.StageProfiler, optional): records every stage of the search
+
+    Returns:
+        LightningSearch: the search, ready for generate_new_table or stream_to
+    """
+    lightning_search = LightningSearch(input_number, include_contaminated=include_contaminated,
+                                       print_data=print_data, datafile=datafile, blocks=blocks,
+                                       profiler=profiler)
+    lightning_search.generic_dataframe_search()
+    if filters:
+        lightning_search.apply_filters(filters)
+    return lightning_search
+
+
 class LightningSearch:
 
     def __init__(self, input_number, carrier=None, include_contaminated=False,
-                 print_data=True, datafile='./phone_numbers.csv'):
+                 print_data=True, datafile='./phone_numbers.csv', blocks=None, profiler=None):
         self.input_number = input_number
         self.carrier = carrier
         self.include_contaminated = include_contaminated
         self.print_data = print_data
         self.datafile = datafile
+        # Optional profiler.StageProfiler timing every stage
+        self.profiler = profiler
+
+        # Raises ValueError for anything that isn't a 10 digit pattern
+        self.automaton = patterns.compile_pattern(self.input_number)
+        # Suffixes of every exchange state of the automaton, built on first use
+        self._suffixes = None
+
+        # Memory-mapped copy of the datafile, rebuilt when the CSV changes.
+        # Callers running many searches can share one already loaded table.
+        if blocks is None:
+            with self.stage('load') as record:
+                blocks = db_cache.load_cache(self.datafile)
+                record['rows_out'] = len(blocks)
+        self.blocks = blocks
+        # Rows of self.blocks that currently match (None means every row)
+        self.rows = None
+        # Central dataframe we are going to search through, built on first use
+        self._dataframe = None
+
+    @property
+    def dataframe(self):
+        """
+        Central dataframe we are going to search through
+        """
+        if self._dataframe is None:
+            self._dataframe = self.blocks.to_dataframe(self.rows)
+        return self._dataframe
+
+    @dataframe.setter
+    def dataframe(self, dataframe):
+        self._dataframe = dataframe
+
+    def select_rows(self, rows):
+        """Narrow the search down to some rows of the block table
+
+        Args:
+            rows (np.ndarray): row positions into self.blocks
+        """
+        self.rows = rows
+        self._dataframe = None
+
+    def _current_rows(self):
+        if self.rows is None:
+            return np.arange(len(self.blocks))
+        return self.rows
+
+    def stage(self, name, rows_in=None):
+        """Time a stage with the profiler, if there is one
+
+        Args:
+            name (str): stage name, see profiler.STAGES
+            rows_in (int, optional): rows going into the stage
+
+        Returns:
+            context manager yielding the stage record, set its 'rows_out'
+        """
+        return stage_profiler.stage(self.profiler, name, rows_in)
 
-        if len(self.input_number) != 10:
-            raise ValueError(f"Expected a 10 Digit phone number, input was \
-                             {len(self.input_number)} chars in length")
-
-        self.input_fs = self.input_number[0:3]
-        self.input_ns = self.input_number[3:6]
-        self.input_ls = self.input_number[6:]
-
-        # REMAP COLUMN NAMES
-        self._new_column_names = ['region','state','NPA','NXX','x','status','code_holder',
-                    'contaminated','tn_not_available','rate_center','block_effective_date',
-                    'block_available_date','carrier','ocn','date_assigned']
-
-        self._column_dtypes = {
-            'region' : str,
-            'state' : str,
-            'NPA' : str,
-            'NXX' : str,
-            'x' : str,
-            'status' : str,
-            'code_holder' : str,
-            'contaminated' : str,
-            'tn_not_available' : str,
-            'rate_center' : str,
-            'block_effective_date' : str,
-            'block_available_date' : str,
-            'carrier' : str,
-            'ocn' : str,
-            'date_assigned' : str
-        }
-
-        # Central dataframe we are going to search through
-        self.dataframe = pd.read_csv(self.datafile, names=self._new_column_names, na_values = 'NONE', dtype=self._column_dtypes)
-
-        # Combos generated with the last four digits, if 'X' was present
-        self.ls_combos = []
-        
     @staticmethod
-    def print_dataframe(dataframe, headers=None):
-        """Print a dataframe
+    def print_dataframe(dataframe, headers=None, limit=None):
+        """Print a dataframe, a page at a time
 
         Args:
             dataframe (dataframe): dataframe
             headers (list, optional): headers to use. Defaults to None.
+            limit (int, optional): print at most this many rows
         """
+        pages = (dataframe[start:start + PAGE_SIZE] for start in range(0, len(dataframe), PAGE_SIZE))
+        widths = [int(dataframe[column].astype(str).str.len().max()) if len(dataframe) else 0
+                  for column in dataframe.columns]
+        LightningSearch.print_pages(pages, headers or list(dataframe.columns), limit, widths, len(dataframe))
 
-        if headers:
-            print(tabulate(dataframe, headers=headers, tablefmt='pipe'))
-        else:
-            print(tabulate(dataframe, headers='keys', tablefmt='pipe'))
+    @staticmethod
+    def print_pages(pages, headers, limit=None, widths=None, total=None) -> int:
+        """Print pages of rows as one pipe table, each page as soon as it arrives
+
+        Every page is laid out like the first, so the table stays aligned
+        across pages: columns are as wide as widths says, or as the first
+        page needs, and a column is right aligned when the first page only
+        has digits in it. A later cell wider than its column still prints
+        whole.
+
+        Args:
+            pages (iterable): dataframes or lists of rows
+            headers (list): headers to use
+            limit (int, optional): print at most this many rows
+            widths (list, optional): width of every column, see column_widths
+            total (int, optional): how many rows there are, to size the index column
+
+        Returns:
+            int: how many rows were printed
+        """
+        printed = 0
+        layout = None
+        for page in pages:
+            if limit is not None:
+                page = page[:limit - printed]
+            if len(page) == 0:
+                break
+            rows = page.itertuples(index=False, name=None) if hasattr(page, 'itertuples') else page
+            rows = [[str(printed + i)] + [_cell(value) for value in row] for i, row in enumerate(rows)]
+            if layout is None:
+                # The index column fits the last row that will be printed
+                counts = [count for count in (total, limit) if count is not None]
+                last = max((min(counts) if counts else len(rows)) - 1, 0)
+                layout = LightningSearch._layout(headers, rows, widths, last)
+                print(layout[0], flush=True)
+            print('\n'.join(_pipe_row(row, *layout[1:]) for row in rows), flush=True)
+            printed += len(rows)
+            if limit is not None and printed >= limit:
+                break
+        if printed == 0:
+            print(LightningSearch._layout(headers, [], widths, 0)[0])
+        return printed
+
+    @staticmethod
+    def _layout(headers, rows, widths, last) -> tuple:
+        # (header and separator lines, width of every column, right alignment
+        # of every column), the index column first
+        measured = column_widths(rows, len(headers) + 1)
+        widths = [len(str(last))] + list(widths or measured[1:])
+        widths = [max(width, len(header), found) for width, header, found in zip(widths, [''] + headers, measured)]
+        right = [True] + [all(row[i].isdigit() for row in rows if row[i]) and any(row[i] for row in rows)
+                          for i in range(1, len(headers) + 1)]
+        separator = '|' + '|'.join('-' * (width + 1) + ':' if align else ':' + '-' * (width + 1)
+                                   for width, align in zip(widths, right)) + '|'
+        return _pipe_row([''] + list(headers), widths, right) + '\n' + separator, widths, right
+
+    @staticmethod
+    def print_summary(summary, limit=None):
+        """Print the result of summarize_exchanges
+
+        Args:
+            summary (dict): summary from summarize_exchanges
+            limit (int, optional): print at most this many exchange rows
+        """
+        print(f"[PHONEBRUTE] {summary['total']} numbers in {summary['blocks']} blocks, "
+              f"{len(summary['exchanges'])} exchange/carrier pairs")
+        exchanges = summary['exchanges']
+        pages = (exchanges[start:start + PAGE_SIZE] for start in range(0, len(exchanges), PAGE_SIZE))
+        LightningSearch.print_pages(pages, SUMMARY_HEADERS, limit,
+                                    column_widths(exchanges, len(SUMMARY_HEADERS)), len(exchanges))
+
+    @staticmethod
+    def summary_widths(summary) -> list:
+        """Size the columns of the new table from a summary, for printing rows that are still to come
+
+        Args:
+            summary (dict): summary from summarize_exchanges
+
+        Returns:
+            list: width of every column of TABLE_HEADERS, dates assumed to be MM/DD/YYYY
+        """
+        widths = column_widths(summary['exchanges'], len(SUMMARY_HEADERS))
+        # Exchange, State, Rate Center and Carrier of the summary
+        return [10, widths[1], 3, 1, widths[2], 10, widths[3], 10]
+
+    @staticmethod
+    def print_counts(counts):
+        """Print the result of count_results
+
+        Args:
+            counts (dict): counts from count_results
+        """
+        from tabulate import tabulate
+
+        print(f"[PHONEBRUTE] {counts['total']} numbers in {counts['blocks']} blocks")
+        for column, breakdown in counts.items():
+            if isinstance(breakdown, dict):
+                print()
+                print(tabulate(breakdown.items(), headers=[column, 'numbers'], tablefmt='pipe'))
 
     @staticmethod
     def export_to_csv(dataframe, filepath):
@@ -91,111 +316,409 @@ class LightningSearch:
             dataframe (pd.dataframe): DataFrame to export
             file_path (str): File path to save the JSON file
         """
-        data_for_writing = dataframe.to_dict(orient='records')
-        with open(filepath, 'w', encoding='utf-8') as datafile:
-            json.dump(data_for_writing, datafile)
-            print(f"Successfully exported dataframe to {filepath}")
+        # Let pandas serialize column by column rather than via a list of dicts
+        dataframe.to_json(filepath, orient='records')
+        print(f"Successfully exported dataframe to {filepath}")
 
-    @staticmethod
-    def generate_combinations(string) -> list:
-        """Generate all possible combinations
-        for 'X' in a phone number 
+    def generic_dataframe_search(self):
+        """
+        Search through the block index and find matching NPA and NXX Values
+        """
+        with self.stage('match', len(self.blocks)) as record:
+            # Only blocks whose thousands digit can start the line number are useful
+            rows = self.blocks.index.lookup(self.automaton)
+
+            if self.include_contaminated is False:
+                non_contaminated = self.blocks.code_of('contaminated', 'N')
+                rows = rows[self.blocks.columns['contaminated'][rows] == non_contaminated]
+
+            self.select_rows(rows)
+            record['rows_out'] = len(rows)
+
+    def advanced_dataframe_search(self, column, regex):
+        """Advanced Dataframe search
+
+        Args:
+            column (str): column to search
+            regex (str): regex to match
+        """
+        self.apply_filters([filters.ColumnFilter(column, regex)])
+
+    def apply_filters(self, column_filters):
+        """Apply several filters in one pass over the current rows
 
         Args:
-            string (string): partial number ex: 9XX or 60X
+            column_filters (list): filters.ColumnFilter objects
+        """
+        rows = self._current_rows()
+        with self.stage('filter', len(rows)) as record:
+            # Every filter is evaluated against the distinct values, then applied by code
+            self.select_rows(filters.apply_filters(self.blocks, rows, column_filters))
+            record['rows_out'] = len(self.rows)
+
+    ################################################
+    #            Phonebrute Stuff                  #
+    ################################################  
+
+    def line_suffixes(self) -> tuple:
+        """Get the possible last four digits of every exchange state of the automaton
 
         Returns:
-            list: all possible combos
+            tuple: (suffixes of every state one after the other, each ascending;
+            offsets where the suffixes of state s with thousands digit d
+            start, at [s, d], and end, at [s, d + 1])
         """
-        comb = []
-        X_indices = [i for i, x in enumerate(string) if x == 'X']
-        possible_values = [str(i) for i in range(10)]
-        for c in itertools.product(possible_values, repeat=len(X_indices)):
-            for i, x in enumerate(X_indices):
-                string = string[:x] + c[i] + string[x+1:]
-            comb.append(string)
-        return comb
+        if self._suffixes is None:
+            table = self.automaton.transitions[6]
+            suffixes = [self.automaton.accepted(4, 6, state) for state in range(len(table))]
+            starts = np.cumsum([0] + [len(state_suffixes) for state_suffixes in suffixes])
+            # Suffixes with thousands digit d live in offsets[d]:offsets[d + 1]
+            offsets = np.array([start + np.searchsorted(state_suffixes, np.arange(11) * 1000)
+                                for start, state_suffixes in zip(starts, suffixes)])
+            self._suffixes = (np.concatenate(suffixes), offsets)
+        return self._suffixes
+
+    def suffix_ranges(self, rows) -> tuple:
+        """Find which suffixes belong to each block row
 
-    def generate_last_four_combos(self):
+        Args:
+            rows (np.ndarray): row positions into self.blocks
+
+        Returns:
+            tuple: (start, stop) positions into the suffixes of line_suffixes for every row
         """
-        Generate all combos of the last four digits if there
-        is an 'X' present
+        _, offsets = self.line_suffixes()
+        # x == -1 (no thousands digit) picks the trailing whole range, and
+        # rows the automaton can't match (state -1) the trailing empty row
+        empty = np.zeros((1, 11), dtype=offsets.dtype)
+        first = np.concatenate((np.concatenate((offsets[:, :10], offsets[:, :1]), axis=1), empty))
+        last = np.concatenate((np.concatenate((offsets[:, 1:], offsets[:, 10:]), axis=1), empty))
+        exchanges = (self.blocks.columns['NPA'][rows].astype(np.int64) * 1000
+                     + self.blocks.columns['NXX'][rows])
+        states = self.automaton.walk(exchanges, 6)
+        blocks = self.blocks.columns['x'][rows]
+        return first[states, blocks], last[states, blocks]
+
+    def expand_rows(self, rows) -> tuple:
+        """Expand block rows into the phone numbers they hold
+
+        Args:
+            rows (np.ndarray): row positions into self.blocks
+
+        Returns:
+            tuple: (numbers as np.int64, block row of every number)
         """
-        if 'X' in self.input_ls:
-            self.ls_combos = self.generate_combinations(self.input_ls)
+        # Each row only gets the suffixes inside its own thousands block
+        suffixes, _ = self.line_suffixes()
+        starts, stops = self.suffix_ranges(rows)
+        counts = stops - starts
+        prefixes = (self.blocks.columns['NPA'][rows].astype(np.int64) * 1000
+                    + self.blocks.columns['NXX'][rows])
+        numbers = (np.repeat(prefixes * 10000, counts)
+                   + suffixes[block_index.ranges_to_rows(starts, stops)])
+        return numbers, np.repeat(rows, counts)
+
+    def build_table(self, numbers, number_rows):
+        """Build the output table for some expanded numbers
 
-    def generic_dataframe_search(self):
+        Args:
+            numbers (np.ndarray): phone numbers as integers
+            number_rows (np.ndarray): block row of every number
+
+        Returns:
+            pd.DataFrame: table with TABLE_HEADERS as columns
         """
-        Search through the CSV and find matching NPA and NXX Values
+        import pandas as pd
+
+        new_table = {'Phone Number': format_numbers(numbers)}
+        for column in TABLE_HEADERS[1:]:
+            codes = self.blocks.columns[column][number_rows]
+            if column in db_cache.INTEGER_COLUMNS:
+                new_table[column] = self.blocks.decoder(column)[codes]
+            else:
+                new_table[column] = pd.Categorical.from_codes(
+                    codes, categories=self.blocks.dictionaries[column])
+        return pd.DataFrame(new_table, columns=TABLE_HEADERS)
+
+    def split_rows(self, chunk_size=streaming.CHUNK_SIZE, rows=None):
+        """Split the matching rows into consecutive pieces of about chunk_size numbers
+
+        Args:
+            chunk_size (int, optional): numbers per piece. A piece always holds
+            at least one block, so it can be larger for very small chunk sizes.
+            rows (np.ndarray, optional): rows to split, in any order. Defaults
+            to the matching rows.
+
+        Yields:
+            np.ndarray: row positions into self.blocks, in order
         """
-        fs_matches = self.dataframe['NPA'] == self.input_fs
-        ns_matches = self.dataframe['NXX'] == self.input_ns
+        rows = self._current_rows() if rows is None else rows
+        starts, stops = self.suffix_ranges(rows)
+        totals = np.cumsum(stops - starts)
 
-        # If the input contains 'X', treat it as a wildcard
-        if 'X' in self.input_fs:
-            possible_values = [self.input_fs.replace('X'*self.input_fs.count('X'), str(i)) for i in range(int(math.pow(10, self.input_fs.count('X'))))]
-            fs_matches = self.dataframe['NPA'].isin(possible_values)
-        if 'X' in self.input_ns:
-            possible_values = [
-                self.input_ns.replace('X'*self.input_ns.count('X'), str(i)) for i in range(int(math.pow(10, self.input_ns.count('X'))))]
-            ns_matches = self.dataframe['NXX'].isin(possible_values)
+        first = 0
+        while first < len(rows):
+            done = totals[first - 1] if first > 0 else 0
+            # Take as many rows as fit, but always at least one
+            last = max(first + 1, int(np.searchsorted(totals, done + chunk_size, side='right')))
+            yield rows[first:last]
+            first = last
 
-        self.dataframe = self.dataframe[fs_matches & ns_matches]
-        
-        if self.include_contaminated is False:
-            non_contaminated_matches = self.dataframe["contaminated"] == "N"
-            self.dataframe = self.dataframe[non_contaminated_matches]
+    def iter_chunks(self, chunk_size=streaming.CHUNK_SIZE):
+        """Expand the matching rows a few blocks at a time
 
-    def advanced_dataframe_search(self, column, regex):
-        """Advanced Dataframe search
+        Args:
+            chunk_size (int, optional): numbers per chunk, see split_rows
+
+        Yields:
+            tuple: (numbers as np.int64, block row of every number)
+        """
+        for rows in self.split_rows(chunk_size):
+            yield self.expand_rows(rows)
+
+    def iter_ranked(self, top=None, chunk_size=streaming.CHUNK_SIZE):
+        """Expand the matching rows best block first, see ranking.block_scores
+
+        Blocks are handed out by ranking.ranked_batches, so the first chunk
+        comes out without scoring being followed by a full sort, and nothing
+        past the top numbers is expanded. Numbers of the same block tie, and
+        come out in ascending order.
 
         Args:
-            column (str): column to search
-            regex (str): regex to match
+            top (int, optional): stop after this many numbers
+            chunk_size (int, optional): numbers per chunk, see split_rows
+
+        Yields:
+            tuple: (numbers as np.int64, block row of every number)
         """
-        # We want to search our new dataframe now
-        self.dataframe = self.dataframe[self.dataframe[column].str.contains(regex, na=False)]
+        rows = self._current_rows()
+        with self.stage('rank', len(rows)) as record:
+            starts, stops = self.suffix_ranges(rows)
+            rows = rows[stops > starts]
+            scores = ranking.block_scores(self.blocks, rows)
+            # Rows out are the blocks handed out for expansion, counted as they go
+            record['rows_out'] = 0
+
+        left = top
+        for batch in ranking.ranked_batches(scores):
+            for chunk_rows in self.split_rows(chunk_size, rows[batch]):
+                record['rows_out'] += len(chunk_rows)
+                numbers, number_rows = self.expand_rows(chunk_rows)
+                if left is not None:
+                    numbers, number_rows = numbers[:left], number_rows[:left]
+                    left -= len(numbers)
+                yield numbers, number_rows
+                if left == 0:
+                    return
+
+    def decode_rows(self, numbers, number_rows) -> list:
+        """Decode some expanded numbers into table rows, without pandas
 
-    ################################################
-    #            Phonebrute Stuff                  #
-    ################################################  
+        Args:
+            numbers (np.ndarray): phone numbers as integers
+            number_rows (np.ndarray): block row of every number
+
+        Returns:
+            list: one list per number, with TABLE_HEADERS as columns
+        """
+        columns = [format_numbers(numbers).tolist()]
+        columns += [self.blocks.decode(column, number_rows).tolist() for column in TABLE_HEADERS[1:]]
+        return [list(row) for row in zip(*columns)]
+
+    def display_widths(self) -> list:
+        """Measure every column of the new table from the matching blocks, without expanding them
+
+        Returns:
+            list: width of every column of TABLE_HEADERS
+        """
+        rows = self._current_rows()
+        widths = [10]
+        for column in TABLE_HEADERS[1:]:
+            values = self.blocks.decoder(column)[np.unique(self.blocks.columns[column][rows])]
+            widths.append(max((len(value) for value in values if value is not None), default=0))
+        return widths
+
+    def iter_pages(self, page_size=PAGE_SIZE, top=None):
+        """Generate the rows of the new table a page at a time, for printing
+
+        Args:
+            page_size (int, optional): rows per page
+            top (int, optional): only the top most plausible numbers, best
+            first, see iter_ranked
+
+        Yields:
+            list: consecutive rows of the table generate_new_table builds, see decode_rows
+        """
+        chunks = self.iter_chunks(page_size) if top is None else self.iter_ranked(top, page_size)
+        for numbers, number_rows in chunks:
+            yield self.decode_rows(numbers, number_rows)
+
+    def write_stream(self, stream, output_format='csv', tag=None, header=True,
+                     chunk_size=streaming.CHUNK_SIZE, top=None) -> int:
+        """Write every generated number to an open text stream, chunk by chunk
+
+        Args:
+            stream (file): text stream to write to
+            output_format (str, optional): csv, jsonl or txt
+            tag (str, optional): pattern to write in front of every number
+            header (bool, optional): write the header, if the format has one
+            chunk_size (int, optional): numbers generated per chunk
+            top (int, optional): only the top most plausible numbers, best
+            first, see iter_ranked
 
-    def generate_new_table(self):
-        """
-        Generate the new table for printing and stuff
-        """
-        new_table = {}
-        headers = ["Phone Number", "state", "NXX", "contaminated", "rate_center",
-                    "block_effective_date", "carrier", "date_assigned"]
-        
-        # Use Seperate Headers so the table output looks nice
-        table_headers = ["Phone Number", "State", "NXX", "Contaminated", "Rate Center",
-                    "Block Effective Date", "Carrier", "Date Assigned"]
-
-        # Combine NPA and NXX
-        self.dataframe['Phone Number'] = self.dataframe['NPA'] + self.dataframe['NXX']
-
-        # Create an empty DataFrame to store the results
-        new_table = pd.DataFrame(columns=headers)
-
-        # If no combos were generated, just copy the dataframe
-        if len(self.ls_combos) == 0:
-            temp_df = self.dataframe.copy()
-            temp_df['Phone Number'] = temp_df['Phone Number'] + self.input_ls
-            new_table = new_table.append(temp_df, ignore_index=True)
-        else:
-            # For each combo, append it to the end of the Phone Number and create a new row
-            for combo in self.ls_combos:
-                temp_df = self.dataframe.copy()
-                temp_df['Phone Number'] = temp_df['Phone Number'] + combo
-                new_table = new_table.append(temp_df, ignore_index=True)
-
-        # Convert nan to NONE
-        new_table.fillna("NONE")
-
-        # Select the necessary columns and reorder them
-        new_table = new_table[headers]
+        Returns:
+            int: how many numbers were written
+        """
+        writer = streaming.WRITERS[output_format](stream, self.blocks, TABLE_HEADERS[1:],
+                                                  tag=tag, header=header)
+        chunks = self.iter_chunks(chunk_size) if top is None else self.iter_ranked(top, chunk_size)
+        for numbers, number_rows in chunks:
+            writer.write(format_numbers(numbers).tolist(), number_rows)
+        writer.close()
+        return writer.count
+
+    def total_numbers(self) -> int:
+        """
+        How many numbers the search generates
+        """
+        starts, stops = self.suffix_ranges(self._current_rows())
+        return int((stops - starts).sum())
+
+    def stream_to(self, output, output_format=None, chunk_size=streaming.CHUNK_SIZE, jobs=1, top=None) -> int:
+        """Write every generated number straight to a file, chunk by chunk
+
+        Args:
+            output (str): file to write to, '-' for stdout
+            output_format (str, optional): csv, jsonl or txt. Defaults to a guess
+            from the file extension.
+            chunk_size (int, optional): numbers generated per chunk
+            jobs (int, optional): worker processes, None for one per core. Searches
+            of more than parallel.MIN_PARALLEL_NUMBERS are rendered in shards by
+            the workers, and written in the same order.
+            top (int, optional): only the top most plausible numbers, best
+            first, see iter_ranked. Always streamed in-process.
+
+        Returns:
+            int: how many numbers were written
+        """
+        output_format = output_format or streaming.format_for_path(output)
+        # One core gains nothing from a pool, only the cost of starting it
+        jobs = jobs or os.cpu_count() or 1
+        with self.stage('stream', len(self._current_rows())) as record:
+            if jobs > 1 and top is None:
+                import parallel
+
+                if self.total_numbers() > parallel.MIN_PARALLEL_NUMBERS:
+                    record['rows_out'] = parallel.stream_parallel(self, output, output_format, jobs)
+                    return record['rows_out']
+            stream = streaming.open_output(output)
+            try:
+                record['rows_out'] = self.write_stream(stream, output_format, chunk_size=chunk_size, top=top)
+            finally:
+                if stream is not sys.stdout:
+                    stream.close()
+        return record['rows_out']
+
+    def count_results(self, by=COUNT_COLUMNS) -> dict:
+        """Count the numbers the search would generate, without generating them
+
+        Args:
+            by (tuple, optional): columns to break the count down by
+
+        Returns:
+            dict: 'total' numbers, matching 'blocks', and for every column in
+            by a dict of value -> numbers, largest first
+        """
+        rows = self._current_rows()
+        with self.stage('count', len(rows)) as record:
+            starts, stops = self.suffix_ranges(rows)
+            counts = stops - starts
+
+            results = {'total': int(counts.sum()), 'blocks': int(np.count_nonzero(counts))}
+            for column in by:
+                # Shift the codes by one so missing values (-1) land in slot 0
+                values = ['NONE'] + list(self.blocks.decoder(column)[:-1])
+                totals = np.bincount(self.blocks.columns[column][rows].astype(np.int64) + 1,
+                                     weights=counts, minlength=len(values))
+                order = np.argsort(-totals, kind='stable')
+                results[column] = {values[i]: int(totals[i]) for i in order if totals[i] > 0}
+            record['rows_out'] = results['total']
+        return results
+
+    def summarize_exchanges(self) -> dict:
+        """Count the numbers per exchange and carrier, without generating them
+
+        Returns:
+            dict: 'total' numbers, matching 'blocks', and 'exchanges', one
+            row per exchange and carrier with SUMMARY_HEADERS as columns,
+            by exchange and then by numbers, largest first
+        """
+        rows = self._current_rows()
+        starts, stops = self.suffix_ranges(rows)
+        counts = stops - starts
+        rows, counts = rows[counts > 0], counts[counts > 0]
+
+        columns = self.blocks.columns
+        exchanges = columns['NPA'][rows].astype(np.int64) * 1000 + columns['NXX'][rows]
+        # Missing carriers (-1) become 0, so every key is unique per pair
+        carriers = columns['carrier'][rows].astype(np.int64) + 1
+        keys = exchanges * (len(self.blocks.dictionaries['carrier']) + 1) + carriers
+        _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        numbers = np.bincount(inverse, weights=counts).astype(np.int64)
+        blocks = np.bincount(inverse)
+        order = np.lexsort((-numbers, exchanges[first]))
+
+        first_rows = rows[first[order]]
+        exchange_names = [f"{npa}-{nxx}" for npa, nxx in zip(self.blocks.decode('NPA', first_rows),
+                                                              self.blocks.decode('NXX', first_rows))]
+        values = [self.blocks.decode(column, first_rows) for column in ('state', 'rate_center', 'carrier')]
+        summary = [[name, state, rate_center, carrier or 'NONE', int(block_count), int(number_count)]
+                   for name, state, rate_center, carrier, block_count, number_count
+                   in zip(exchange_names, *values, blocks[order], numbers[order])]
+        return {'total': int(counts.sum()), 'blocks': len(rows), 'exchanges': summary}
+
+    def print_results(self, limit=None, full=False, summary_threshold=SUMMARY_THRESHOLD, top=None):
+        """Print the results a page at a time, or a summary if there are many
+
+        Args:
+            limit (int, optional): print at most this many rows
+            full (bool, optional): print every row, however many there are
+            summary_threshold (int, optional): print a summary per exchange
+            instead of rows above this many numbers, unless limit, full or top is given
+            top (int, optional): only the top most plausible numbers, best
+            first, see iter_ranked
+        """
+        rows = self._current_rows()
+        with self.stage('render', len(rows)) as record:
+            if limit is None and not full and top is None and self.total_numbers() > summary_threshold:
+                summary = self.summarize_exchanges()
+                self.print_summary(summary)
+                print(f"[PHONEBRUTE] Showing a summary of {summary['total']} numbers, "
+                      f"use --head N to print the first N, or --all for every one")
+                record['rows_out'] = len(summary['exchanges'])
+            else:
+                total = self.total_numbers() if top is None else min(top, self.total_numbers())
+                record['rows_out'] = self.print_pages(self.iter_pages(PAGE_SIZE, top), DISPLAY_HEADERS, limit,
+                                                      self.display_widths(), total)
+
+    def generate_new_table(self, top=None):
+        """
+        Generate the new table for printing and stuff, or just its top most
+        plausible numbers, best first
+        """
+        rows = self._current_rows()
+        with self.stage('expand', len(rows)) as record:
+            if top is None:
+                new_table = self.build_table(*self.expand_rows(rows))
+            else:
+                chunks = list(self.iter_ranked(top))
+                new_table = self.build_table(
+                    np.concatenate([numbers for numbers, _ in chunks] + [np.empty(0, dtype=np.int64)]),
+                    np.concatenate([number_rows for _, number_rows in chunks] + [np.empty(0, dtype=np.int64)]))
+            record['rows_out'] = len(new_table)
         if self.print_data:
-            self.print_dataframe(new_table, headers=table_headers)
+            with self.stage('render', len(new_table)) as record:
+                self.print_dataframe(new_table, headers=DISPLAY_HEADERS)
+                record['rows_out'] = len(new_table)
 
         return new_table
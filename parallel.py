@@ -0,0 +1,205 @@
+# Parallel Enumeration
+# Expand and render huge searches shard by shard in a process pool, then
+# write the shards back out in order
+import io
+import os
+import sys
+import collections
+import concurrent.futures
+from multiprocessing import shared_memory
+import db_cache
+import lightning_searcher
+import streaming
+
+# Numbers per shard, big enough that a worker spends its time rendering
+# rather than passing messages, small enough to keep a rendered shard (up to
+# ~200 bytes a number as jsonl) in memory
+SHARD_SIZE = streaming.CHUNK_SIZE
+
+# Smaller searches are streamed in-process, a pool isn't worth starting for them
+MIN_PARALLEL_NUMBERS = 1000000
+
+# Shards rendered but not yet written, per worker, so memory stays bounded
+# when an early shard is slow
+SHARDS_IN_FLIGHT = 2
+
+# Block table of a worker process, opened once by _init_worker
+_worker_blocks = None
+
+
+def _init_worker(cache_path):
+    global _worker_blocks
+    # The cache is memory-mapped, so every worker shares the same pages
+    _worker_blocks = db_cache.BlockTable.open(cache_path)
+
+
+def hand_off(data):
+    """
+    Put rendered bytes somewhere the parent can read them without pickling
+    """
+    if os.name != 'posix':
+        # Windows frees shared memory with its last handle, so just return the bytes
+        return data
+    shm = shared_memory.SharedMemory(create=True, size=max(1, len(data)))
+    shm.buf[:len(data)] = data
+    shm.close()
+    return shm.name, len(data)
+
+
+def write_shard(stream, result) -> int:
+    """
+    Write (and free) a shard returned by render_shard, straight from shared memory
+    """
+    handle, count = result
+    if isinstance(handle, bytes):
+        stream.write(handle)
+        return count
+    name, size = handle
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        view = shm.buf[:size]
+        try:
+            stream.write(view)
+        finally:
+            view.release()
+    finally:
+        shm.close()
+        shm.unlink()
+    return count
+
+
+def render_shard(input_number, rows, output_format, tag=None) -> tuple:
+    """Expand and render one shard in a worker process
+
+    Args:
+        input_number (str): the searched pattern
+        rows (np.ndarray): consecutive matching rows of the block table
+        output_format (str): csv, jsonl or txt
+        tag (str, optional): pattern to write in front of every number
+
+    Returns:
+        tuple: (handle for write_shard, how many numbers were rendered)
+    """
+    lightning_search = lightning_searcher.LightningSearch(input_number, print_data=False,
+                                                          blocks=_worker_blocks)
+    lightning_search.select_rows(rows)
+    output = io.StringIO()
+    count = lightning_search.write_stream(output, output_format, tag=tag, header=False)
+    return hand_off(output.getvalue().encode('utf-8')), count
+
+
+def stream_parallel(lightning_search, output, output_format=None, jobs=None, tag=None,
+                    shard_size=SHARD_SIZE) -> int:
+    """Write every number of a search to a file, rendering shards in parallel
+
+    Shards are consecutive runs of the sorted block rows, and are written
+    in the order they were cut, so the output is the same as stream_to's.
+
+    Args:
+        lightning_search (lightning_searcher.LightningSearch): a search with its rows selected
+        output (str): file to write to, '-' for stdout
+        output_format (str, optional): csv, jsonl or txt. Defaults to a guess
+        from the file extension.
+        jobs (int, optional): worker processes. Defaults to one per core.
+        tag (str, optional): pattern to write in front of every number
+        shard_size (int, optional): numbers per shard
+
+    Returns:
+        int: how many numbers were written
+    """
+    output_format = output_format or streaming.format_for_path(output)
+    jobs = jobs or os.cpu_count() or 1
+    blocks = lightning_search.blocks
+    shards = lightning_search.split_rows(shard_size)
+
+    # Header first, the shards are rendered without one
+    header = io.StringIO()
+    streaming.WRITERS[output_format](header, blocks, lightning_searcher.TABLE_HEADERS[1:], tag=tag).close()
+
+    if output == '-':
+        # Anything already printed has to come out before the raw bytes
+        sys.stdout.flush()
+    stream = sys.stdout.buffer if output == '-' else open(output, 'wb')
+    try:
+        stream.write(header.getvalue().encode('utf-8'))
+        return write_shards(stream, ((lightning_search.input_number, rows, output_format, tag) for rows in shards),
+                            jobs, blocks.path)
+    finally:
+        if output == '-':
+            stream.flush()
+        else:
+            stream.close()
+
+
+def worker_blocks():
+    """
+    Block table of this worker process, opened by the pool start_pool started
+    """
+    return _worker_blocks
+
+
+def start_pool(jobs, cache_path):
+    """Start worker processes that each open the cache once
+
+    Args:
+        jobs (int): worker processes
+        cache_path (str): cache directory the workers open
+
+    Returns:
+        concurrent.futures.ProcessPoolExecutor: the pool, to use as a context manager
+    """
+    if os.name == 'posix':
+        # Start the tracker before forking, so workers register shared memory
+        # with the same tracker the parent unregisters it from
+        from multiprocessing import resource_tracker
+        resource_tracker.ensure_running()
+    return concurrent.futures.ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker,
+                                                  initargs=(cache_path,))
+
+
+def write_in_order(stream, executor, tasks, in_flight, write=None) -> int:
+    """Run tasks in a pool and write their results in the order given
+
+    At most in_flight tasks are running or done but not yet written, and
+    tasks are only taken from the iterable as they are handed out, so
+    memory stays bounded however many there are.
+
+    Args:
+        stream (file): binary stream to write to
+        executor (concurrent.futures.Executor): the pool, see start_pool
+        tasks (iterable): (function, arguments) of every task
+        in_flight (int): tasks handed out ahead of the one being written
+        write (callable, optional): writes a result to the stream and returns
+        how many numbers it held. Defaults to writing a render_shard result.
+
+    Returns:
+        int: how many numbers were written
+    """
+    write = write or write_shard
+    written = 0
+    pending = collections.deque()
+    for function, arguments in tasks:
+        pending.append(executor.submit(function, *arguments))
+        if len(pending) >= in_flight:
+            written += write(stream, pending.popleft().result())
+    while pending:
+        written += write(stream, pending.popleft().result())
+    return written
+
+
+def write_shards(stream, shards, jobs, cache_path) -> int:
+    """Render shards in a process pool and write them in the order given
+
+    Args:
+        stream (file): binary stream to write to
+        shards (iterable): (input_number, rows, output_format, tag) of every
+        shard, see render_shard
+        jobs (int): worker processes
+        cache_path (str): cache directory the workers open
+
+    Returns:
+        int: how many numbers were written
+    """
+    with start_pool(jobs, cache_path) as executor:
+        return write_in_order(stream, executor, ((render_shard, shard) for shard in shards),
+                              jobs * SHARDS_IN_FLIGHT)
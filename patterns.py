@@ -0,0 +1,249 @@
+# Digit Patterns
+# Parse partial numbers like 9XX, 60X, 312[2-5]XXXXXX or (312|773)555XXXX and
+# compile them into digit automatons
+
+WILDCARD = 'X'
+
+# Every digit allowed, as a bit mask (bit d set when digit d is allowed)
+ALL_DIGITS = (1 << 10) - 1
+
+# Alternatives a pattern may expand to before it is refused, ex: 10 groups of
+# 3 alternatives each would be 59,049
+MAX_SEQUENCES = 4096
+
+SYNTAX = "use digits, 'X', classes like [2-5] or [^0], and alternatives like (312|773) or 312XXXXXXX|773XXXXXXX"
+
+
+class _Parser:
+    """
+    Recursive descent over a pattern, producing every digit sequence it
+    can stand for. A sequence is a tuple of bit masks, one per position.
+    """
+
+    def __init__(self, pattern):
+        self.pattern = pattern
+        self.position = 0
+
+    def error(self, message):
+        return ValueError(f"{message} in {self.pattern!r}, {SYNTAX}")
+
+    def peek(self):
+        return self.pattern[self.position] if self.position < len(self.pattern) else None
+
+    def take(self):
+        char = self.peek()
+        self.position += 1
+        return char
+
+    def parse(self) -> list:
+        sequences = self.alternatives()
+        if self.peek() is not None:
+            raise self.error(f"Unexpected {self.peek()!r} at position {self.position}")
+        return sequences
+
+    def alternatives(self) -> list:
+        sequences = self.concatenation()
+        while self.peek() == '|':
+            self.take()
+            sequences = sequences + self.concatenation()
+            self.check_size(sequences)
+        return list(dict.fromkeys(sequences))
+
+    def concatenation(self) -> list:
+        sequences = [()]
+        while self.peek() not in (None, '|', ')'):
+            items = self.item()
+            sequences = [sequence + item for sequence in sequences for item in items]
+            self.check_size(sequences)
+        return sequences
+
+    def item(self) -> list:
+        char = self.take()
+        if char == WILDCARD:
+            return [(ALL_DIGITS,)]
+        if char.isdigit() and char.isascii():
+            return [(1 << int(char),)]
+        if char == '[':
+            return [(self.digit_class(),)]
+        if char == '(':
+            sequences = self.alternatives()
+            if self.take() != ')':
+                raise self.error("Unclosed (")
+            return sequences
+        raise self.error(f"Unexpected character {char!r}")
+
+    def digit_class(self) -> int:
+        negate = self.peek() == '^'
+        if negate:
+            self.take()
+        mask = 0
+        while self.peek() != ']':
+            first = self.take()
+            if first is None:
+                raise self.error("Unclosed [")
+            if not (first.isdigit() and first.isascii()):
+                raise self.error(f"Unexpected character {first!r} in a digit class")
+            last = first
+            if self.peek() == '-':
+                self.take()
+                last = self.take()
+                if last is None or not (last.isdigit() and last.isascii()) or last < first:
+                    raise self.error(f"Bad range {first}-{last or ''}")
+            for digit in range(int(first), int(last) + 1):
+                mask |= 1 << digit
+        self.take()
+        if negate:
+            mask = ALL_DIGITS & ~mask
+        if mask == 0:
+            raise self.error("Empty digit class")
+        return mask
+
+    def check_size(self, sequences):
+        if len(sequences) > MAX_SEQUENCES:
+            raise self.error(f"More than {MAX_SEQUENCES} alternatives")
+
+
+def parse(pattern, length=None) -> list:
+    """Get every digit sequence a pattern stands for
+
+    Doesn't need numpy, so the command line can check patterns before
+    loading anything.
+
+    Args:
+        pattern (string): partial number ex: 9XX, 60[0-4] or (312|773)555XXXX
+        length (int, optional): digits every alternative must have
+
+    Raises:
+        ValueError: if the pattern isn't valid, or an alternative has the wrong length
+
+    Returns:
+        list: tuples of bit masks, one per position, bit d set when digit d is allowed
+    """
+    sequences = _Parser(pattern).parse()
+    if length is not None:
+        for sequence in sequences:
+            if len(sequence) != length:
+                which = "is" if len(sequences) == 1 else "has an alternative"
+                raise ValueError(f"Expected a {length} digit phone number, {pattern!r} {which} "
+                                 f"{len(sequence)} digits long")
+    return sequences
+
+
+class DigitAutomaton:
+    """
+    Minimal deterministic automaton over a fixed number of digits. States
+    are numbered per depth (digits read so far); transitions[d] maps
+    (state at depth d, digit) to a state at depth d + 1, or -1 once no
+    alternative can match. Depth 0 has the single start state 0.
+    """
+
+    def __init__(self, transitions):
+        self.transitions = transitions
+        self.length = len(transitions)
+
+    @classmethod
+    def from_sequences(cls, sequences):
+        """Compile digit sequences into an automaton
+
+        Args:
+            sequences (list): tuples of bit masks of the same length, see parse
+
+        Returns:
+            DigitAutomaton: automaton accepting the union of the sequences
+        """
+        import numpy as np
+
+        length = len(sequences[0])
+        # Subset construction: a state is the set of sequences still matching,
+        # as one bit per sequence
+        states = [(1 << len(sequences)) - 1]
+        transitions = []
+        for depth in range(length):
+            digit_sequences = [sum(1 << i for i, sequence in enumerate(sequences)
+                                   if sequence[depth] >> digit & 1) for digit in range(10)]
+            next_states = {}
+            table = np.full((len(states), 10), -1, dtype=np.int32)
+            for i, state in enumerate(states):
+                for digit, matching in enumerate(digit_sequences):
+                    if state & matching:
+                        table[i, digit] = next_states.setdefault(state & matching, len(next_states))
+            transitions.append(table)
+            states = list(next_states)
+        return cls(_minimize(transitions))
+
+    def walk(self, values, digits, depth=0, states=None) -> 'np.ndarray':
+        """Feed zero-padded values to the automaton
+
+        Args:
+            values (np.ndarray): integers of up to `digits` digits
+            digits (int): digits to read from every value
+            depth (int, optional): depth the values start at
+            states (np.ndarray, optional): state to start every value from.
+            Defaults to the start state.
+
+        Returns:
+            np.ndarray: state after reading every value, -1 where it can't match
+        """
+        import numpy as np
+
+        values = np.asarray(values, dtype=np.int64)
+        states = np.zeros(len(values), dtype=np.int32) if states is None else np.asarray(states, dtype=np.int32)
+        for position in range(digits):
+            digit = values // 10 ** (digits - 1 - position) % 10
+            live = states >= 0
+            states = np.where(live, self.transitions[depth + position][np.maximum(states, 0), digit], -1)
+        return states
+
+    def accepted(self, digits, depth=0, state=0) -> 'np.ndarray':
+        """Get every value that takes a state to the end
+
+        Args:
+            digits (int): digits left until the end
+            depth (int, optional): depth of the state
+            state (int, optional): state to start from
+
+        Returns:
+            np.ndarray: accepted zero-padded values, ascending
+        """
+        import numpy as np
+
+        states = np.full(1, state, dtype=np.int32)
+        for position in range(depth, depth + digits):
+            states = np.where(states[:, None] >= 0, self.transitions[position][np.maximum(states, 0)], -1).ravel()
+        return np.flatnonzero(states >= 0)
+
+
+def _minimize(transitions) -> list:
+    # Merge the states of each depth with identical transitions, from the last
+    # depth back, renumbering the next depth as it goes
+    import numpy as np
+
+    minimized = [None] * len(transitions)
+    # Every state after the last digit accepts, so they are all one state
+    renumber = np.zeros(int(transitions[-1].max()) + 1, dtype=np.int32)
+    for depth in range(len(transitions) - 1, -1, -1):
+        table = np.where(transitions[depth] >= 0, renumber[np.maximum(transitions[depth], 0)], -1).astype(np.int32)
+        unique, first, renumber = np.unique(table, axis=0, return_index=True, return_inverse=True)
+        # Keep the states in order of first appearance
+        order = np.argsort(first)
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        minimized[depth] = unique[order].astype(np.int32)
+        renumber = rank[renumber.ravel()].astype(np.int32)
+    return minimized
+
+
+def compile_pattern(pattern, length=10) -> DigitAutomaton:
+    """Compile a pattern into a digit automaton
+
+    Args:
+        pattern (string): pattern ex: 312555XXXX, 312[^0]XXXXXX or 312555XXXX|773555XXXX
+        length (int, optional): digits every alternative must have
+
+    Raises:
+        ValueError: if the pattern isn't valid, or an alternative has the wrong length
+
+    Returns:
+        DigitAutomaton: the automaton
+    """
+    return DigitAutomaton.from_sequences(parse(pattern, length))
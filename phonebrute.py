@@ -1,6 +1,11 @@
 import argparse
-import lightning_searcher
-import db_downloader
+import json
+import shutil
+import sys
+import patterns
+import profiler
+# Heavy modules (numpy, pandas, tabulate, tqdm) are imported by the code paths
+# that need them, so -h, bad input and server searches start fast
 
 banner = """
 ██████╗ ██╗  ██╗ ██████╗ ███╗   ██╗███████╗██████╗ ██████╗ ██╗   ██╗████████╗███████╗
@@ -14,35 +19,375 @@ https://github.com/ef1500/phonebrute
 
 """
 
-parser = argparse.ArgumentParser(prog="Phonebrute", description='Generate valid phone numbers with NPA-NXX databases')
-parser.add_argument("NUMBER", metavar="NUM", help="Phone number to search for in the database")
+# Options shared by every command that searches
+filter_parser = argparse.ArgumentParser(add_help=False)
+filter_parser.add_argument("-iC", "--include_contaminated", default=False, action="store_true", help='Include Contaminated Entries')
+filter_parser.add_argument("-rC", "--ratecenter", type=str, action="append", help="Search For a certain rate center, prefix with ! to exclude it, repeat for any of several (exclusions all apply)")
+filter_parser.add_argument("-c", "--carrier", type=str, action="append", help="Search for a certain carrier, prefix with ! to exclude it, repeat for any of several (exclusions all apply)")
+filter_parser.add_argument("-s", "--state", type=str, action="append", help="Search for numbers from a specific state by their abbreviation, prefix with ! to exclude it, repeat for any of several (exclusions all apply)")
+filter_parser.add_argument("-m", "--match", choices=["regex", "exact", "prefix"], default="regex", help="How -rC, -c and -s match, regex by default")
+
+parser = argparse.ArgumentParser(prog="Phonebrute", description='Generate valid phone numbers with NPA-NXX databases',
+                                 parents=[filter_parser], epilog="Other commands: phonebrute batch -h, phonebrute annotate -h, phonebrute validate -h, phonebrute serve -h, phonebrute update -h")
+parser.add_argument("NUMBER", metavar="NUM", nargs="+", help="Phone number to search for in the database, X for any digit, [2-5] or [^0] for some digits, (312|773) for alternatives. Several numbers are searched together")
 parser.add_argument("-nP", "--noprint", default=False, action="store_true", help="Don't print the results in a table")
-parser.add_argument("-iC", "--include_contaminated", default=False, action="store_true", help='Include Contaminated Entries')
-parser.add_argument("-rC", "--ratecenter", type=str, default="ALL", help="Search For a certain rate center")
-parser.add_argument("-c", "--carrier", type=str, default="ALL", help="Search for a certain carrier")
-parser.add_argument("-s", "--state", type=str, default="ALL", help="Search for numbers from a specific state by their abbreviation")
+parser.add_argument("--head", "--limit", dest="limit", type=int, default=None, help="Print only the first N results")
+parser.add_argument("--top", type=int, default=None, help="Only the N most plausible numbers, best first, with blocks ranked by status, age, contamination and carrier")
+parser.add_argument("--all", default=False, action="store_true", help="Print every result, instead of a summary per exchange when there are many")
 parser.add_argument("-o", "--output", default="None", type=str, help="Output file, csv or json")
+parser.add_argument("-S", "--stream", default=False, action="store_true", help="Stream numbers straight to the output file (or stdout) instead of building a table")
+parser.add_argument("-f", "--format", choices=["csv", "jsonl", "txt"], default=None, help="Format for --stream, guessed from the output file extension by default (.json streams json lines)")
+parser.add_argument("-j", "--jobs", type=int, default=None, help="Worker processes for --stream, used for searches over a million numbers, one per core by default")
+parser.add_argument("-C", "--count", default=False, action="store_true", help="Only count the numbers (with a breakdown by state, carrier and rate center), -o writes the counts as json")
+parser.add_argument("--server", type=str, default=None, help="Phonebrute server to send the search to (http://host:port or unix:///path), $PHONEBRUTE_SERVER or a local server is used if running")
+parser.add_argument("--local", default=False, action="store_true", help="Search locally even if a server is running")
+parser.add_argument("--profile", nargs="?", const="table", choices=["table", "json"], default=None, help="Report time, peak memory and rows in/out of every stage to stderr, as a table (default) or json")
+
+batch_parser = argparse.ArgumentParser(prog="Phonebrute batch", description='Search many phone numbers with one load of the database',
+                                       parents=[filter_parser])
+batch_parser.add_argument("INPUT", help="File with one phone number per line, - for stdin")
+batch_parser.add_argument("-o", "--output", default="-", type=str, help="Output file, stdout by default")
+batch_parser.add_argument("-f", "--format", choices=["csv", "jsonl", "txt"], default=None, help="Output format, guessed from the output file extension by default")
+batch_parser.add_argument("-j", "--jobs", type=int, default=None, help="Worker processes, one per core by default")
+
+annotate_parser = argparse.ArgumentParser(prog="Phonebrute annotate", description='Look up the state, rate center and carrier of full phone numbers')
+annotate_parser.add_argument("INPUT", help="File with one full phone number per line, - for stdin")
+annotate_parser.add_argument("-o", "--output", default="-", type=str, help="Output file, stdout by default")
+annotate_parser.add_argument("-f", "--format", choices=["csv", "jsonl"], default=None, help="Output format, guessed from the output file extension by default, csv for stdout")
+
+validate_parser = argparse.ArgumentParser(prog="Phonebrute validate", description='Keep only the full phone numbers that are in an assigned block')
+validate_parser.add_argument("INPUT", help="File with one full phone number per line, - for stdin")
+validate_parser.add_argument("-o", "--output", default="-", type=str, help="Output file, stdout by default")
+validate_parser.add_argument("-iC", "--include_contaminated", default=False, action="store_true", help="Keep numbers in contaminated blocks")
+validate_parser.add_argument("--invert", default=False, action="store_true", help="Keep the numbers that aren't valid instead")
+
+serve_parser = argparse.ArgumentParser(prog="Phonebrute serve", description='Keep the database loaded and answer searches over HTTP')
+serve_parser.add_argument("--host", type=str, default="127.0.0.1", help="Address to listen on")
+serve_parser.add_argument("--port", type=int, default=8642, help="Port to listen on")
+serve_parser.add_argument("--socket", type=str, default=None, help="Listen on this Unix socket instead of a port")
+serve_parser.add_argument("-v", "--verbose", default=False, action="store_true", help="Log every request")
+
+update_parser = argparse.ArgumentParser(prog="Phonebrute update", description='Refresh the database if the report on the server changed')
+update_parser.add_argument("--url", type=str, default=None, help="Where to download the report from")
+update_parser.add_argument("--force", default=False, action="store_true", help="Accept a report with far fewer blocks than the current one")
+update_parser.add_argument("--rollback", default=False, action="store_true", help="Go back to the database as it was before the last update")
+
+
+def check_number(numbers) -> str:
+    """
+    Exit with a message if a pattern can't be a phone number, before anything heavy is loaded.
+    Returns the patterns joined into one, so they are searched together.
+    """
+    for number in numbers:
+        try:
+            patterns.parse(number, length=10)
+        except ValueError as error:
+            sys.exit(f"[PHONEBRUTE] {error}")
+    return '|'.join(numbers)
+
+
+def filters_from_args(args) -> list:
+    """Collect the filter options that were given
+
+    Args:
+        args (argparse.Namespace): parsed arguments
+
+    Returns:
+        list: filters.ColumnFilter objects
+    """
+    import filters
+
+    try:
+        return filters.from_options(vars(args), args.match)
+    except ValueError as error:
+        sys.exit(f"[PHONEBRUTE] {error}")
+
+
+def check_format(output, output_format) -> str:
+    """
+    Exit with a message if the output format can't be told from the file name, before anything is searched.
+    Returns the format to write.
+    """
+    import streaming
+
+    try:
+        return output_format or streaming.format_for_path(output)
+    except ValueError as error:
+        sys.exit(f"[PHONEBRUTE] {error}")
+
+
+def server_params(args) -> dict:
+    """Translate the search options into query parameters for a server
+
+    Args:
+        args (argparse.Namespace): parsed arguments
+
+    Returns:
+        dict: query parameters for /search
+    """
+    params = {
+        'number' : args.NUMBER,
+        'include_contaminated' : int(args.include_contaminated),
+        'ratecenter' : args.ratecenter or [],
+        'carrier' : args.carrier or [],
+        'state' : args.state or [],
+        'match' : args.match
+    }
+    if args.top is not None:
+        params['top'] = args.top
+    return params
+
+
+def show_counts(args, counts):
+    """
+    Print the counts of a --count search and write them to the output file
+    """
+    import lightning_searcher
+
+    lightning_searcher.LightningSearch.print_counts(counts)
+    if not args.output == "None":
+        with open(args.output, 'w', encoding='utf-8') as countfile:
+            json.dump(counts, countfile)
+        print(f"Successfully exported counts to {args.output}")
+
+
+def run_local_search(args, stream_output, stage_profiler=None):
+    """Search in this process
+
+    Returns:
+        pd.DataFrame: the results, or None if they were streamed
+    """
+    import db_downloader
+    import lightning_searcher
+
+    with profiler.stage(stage_profiler, 'download'):
+        db_downloader.download_and_extract('phone_numbers.csv') #  Download Database First Thing if we don't have it
+    lightning_search = lightning_searcher.search(args.NUMBER, include_contaminated=args.include_contaminated,
+                                                 filters=filters_from_args(args), profiler=stage_profiler)
+    if args.count:
+        show_counts(args, lightning_search.count_results())
+        return None
+    if args.stream:
+        written = lightning_search.stream_to(stream_output, args.format, jobs=args.jobs, top=args.top)
+        if not stream_output == "-":
+            print(f"Streamed {written} numbers to {stream_output}")
+        return None
+    if not args.noprint:
+        lightning_search.print_results(args.limit, args.all, top=args.top)
+    if args.output == "None":
+        # Only an export needs the whole table
+        return None
+    return lightning_search.generate_new_table(args.top)
+
+
+def run_remote_search(args, stream_output, server_url):
+    """Send the search to a running server
+
+    Returns:
+        pd.DataFrame: the results, or None if they were streamed
+    """
+    import client
+
+    if args.count:
+        show_counts(args, json.load(client.request(server_url, '/count', server_params(args))))
+        return None
+    if args.stream:
+        response = client.request(server_url, '/search', dict(server_params(args), format=args.format))
+        if stream_output == "-":
+            shutil.copyfileobj(response, sys.stdout.buffer)
+        else:
+            with open(stream_output, 'wb') as output_file:
+                shutil.copyfileobj(response, output_file)
+            print(f"Streamed results to {stream_output}")
+        return None
+
+    import pandas as pd
+    import lightning_searcher
+
+    printed = args.noprint
+    widths = total = None
+    if not printed:
+        # The summary sizes the printed columns, or replaces the rows when there are many
+        summary = json.load(client.request(server_url, '/summary', server_params(args)))
+        widths = lightning_searcher.LightningSearch.summary_widths(summary)
+        total = summary['total'] if args.top is None else min(args.top, summary['total'])
+        if args.limit is None and not args.all and args.top is None and total > lightning_searcher.SUMMARY_THRESHOLD:
+            lightning_searcher.LightningSearch.print_summary(summary)
+            printed = True
+
+    if printed and args.output == "None":
+        return None
 
-args = parser.parse_args()
-print(banner)
-db_downloader.download_and_extract('phone_numbers.csv') #  Download Database First Thing if we don't have it
-
-lightning_search = lightning_searcher.LightningSearch(args.NUMBER, include_contaminated=args.include_contaminated, print_data=not args.noprint)
-lightning_search.generate_last_four_combos()
-#print(f"[PHONEBRUTE] Generated {len(numbers)} phone numbers")
-lightning_search.generic_dataframe_search()
-if not args.ratecenter == "ALL":
-    lightning_search.advanced_dataframe_search('rate_center', args.ratecenter)
-if not args.carrier == "ALL":
-    lightning_search.advanced_dataframe_search('carrier', args.carrier)
-if not args.state == "ALL":
-    lightning_search.advanced_dataframe_search('state', args.state)
-
-valid_numbers = lightning_search.generate_new_table()
-
-if not args.output == "None":
-    split_filename = args.output.split('.')
-    if split_filename[-1] == "csv":
-        lightning_search.export_to_csv(valid_numbers, args.output)
+    response = client.request(server_url, '/search', dict(server_params(args), format='csv'))
+    if args.output == "None":
+        # Read only as many pages as get printed
+        with pd.read_csv(response, dtype=str, chunksize=lightning_searcher.PAGE_SIZE) as pages:
+            lightning_searcher.LightningSearch.print_pages(pages, lightning_searcher.DISPLAY_HEADERS, args.limit,
+                                                           widths, total)
+        response.close()
+        return None
+    valid_numbers = pd.read_csv(response, dtype=str)
+    if not printed:
+        lightning_searcher.LightningSearch.print_dataframe(valid_numbers, lightning_searcher.DISPLAY_HEADERS, args.limit)
+    return valid_numbers
+
+
+def run_search(args):
+    """
+    Search for a single phone number, on a server if one is running
+    """
+    args.NUMBER = check_number(args.NUMBER)
+    if args.top is not None and args.top < 1:
+        sys.exit("[PHONEBRUTE] --top needs a positive number of results")
+    if args.limit is not None and args.limit < 0:
+        sys.exit("[PHONEBRUTE] --head can't be negative")
+    import client
+
+    stream_output = args.output if not args.output == "None" else "-"
+    if args.stream:
+        args.format = check_format(stream_output, args.format)
+    if not (args.stream and stream_output == "-"):
+        print(banner)
+
+    stage_profiler = profiler.StageProfiler() if args.profile else None
+    server_url = None if args.local else client.find_server(args.server)
+    try:
+        if server_url:
+            # The server does the work, so only the round trip can be timed
+            with profiler.stage(stage_profiler, 'remote') as record:
+                valid_numbers = run_remote_search(args, stream_output, server_url)
+                record['rows_out'] = None if valid_numbers is None else len(valid_numbers)
+        else:
+            valid_numbers = run_local_search(args, stream_output, stage_profiler)
+    except client.ServerError as error:
+        sys.exit(f"[PHONEBRUTE] {error}")
+
+    if valid_numbers is not None and not args.output == "None":
+        import lightning_searcher
+
+        split_filename = args.output.split('.')
+        with profiler.stage(stage_profiler, 'export', len(valid_numbers)) as record:
+            if split_filename[-1] == "csv":
+                lightning_searcher.LightningSearch.export_to_csv(valid_numbers, args.output)
+            else:
+                lightning_searcher.LightningSearch.export_to_json(valid_numbers, args.output)
+            record['rows_out'] = len(valid_numbers)
+
+    if stage_profiler is not None:
+        stage_profiler.report(args.profile)
+
+
+def run_batch(argv):
+    """
+    Search for every phone number in a file
+    """
+    import batch
+    import db_downloader
+
+    args = batch_parser.parse_args(argv)
+    args.format = check_format(args.output, args.format)
+    if not args.output == "-":
+        print(banner)
+    db_downloader.download_and_extract('phone_numbers.csv')
+
+    patterns = batch.read_patterns(args.INPUT)
+    searched = batch.run_batch(patterns, args.output, args.format, args.include_contaminated,
+                               filters_from_args(args), args.jobs)
+    if not args.output == "-":
+        print(f"Searched {searched} numbers, results written to {args.output}")
+
+
+def run_annotate(argv):
+    """
+    Annotate every full phone number in a file with its block
+    """
+    import annotate
+    import db_downloader
+
+    args = annotate_parser.parse_args(argv)
+    if not args.output == "-":
+        args.format = check_format(args.output, args.format)
+        print(banner)
+    db_downloader.download_and_extract('phone_numbers.csv')
+
+    read, found = annotate.run_annotate(args.INPUT, args.output, args.format)
+    if not args.output == "-":
+        print(f"[PHONEBRUTE] Annotated {read} numbers, {found} found, results written to {args.output}")
+
+
+def run_validate(argv):
+    """
+    Filter a list of full phone numbers down to the valid ones
+    """
+    import annotate
+    import db_downloader
+
+    args = validate_parser.parse_args(argv)
+    if not args.output == "-":
+        print(banner)
+    db_downloader.download_and_extract('phone_numbers.csv')
+
+    read, written = annotate.run_validate(args.INPUT, args.output, args.include_contaminated, args.invert)
+    if not args.output == "-":
+        print(f"[PHONEBRUTE] Kept {written} of {read} numbers, results written to {args.output}")
+
+
+def run_serve(argv):
+    """
+    Keep the database loaded and answer searches until interrupted
+    """
+    import server
+    import db_downloader
+
+    args = serve_parser.parse_args(argv)
+    print(banner)
+    db_downloader.download_and_extract('phone_numbers.csv')
+    server.serve(args.host, args.port, args.socket, verbose=args.verbose)
+
+
+def run_update(argv):
+    """
+    Refresh the database, or roll the last refresh back
+    """
+    import db_downloader
+
+    args = update_parser.parse_args(argv)
+    print(banner)
+    if args.rollback:
+        try:
+            db_downloader.rollback_database('phone_numbers.csv')
+        except FileNotFoundError as error:
+            sys.exit(f"[PHONEBRUTE] {error}")
+        print("[PHONEBRUTE] Rolled the database back to the previous snapshot")
+        return
+
+    try:
+        changes = db_downloader.update_database('phone_numbers.csv', args.url or db_downloader.URL, args.force)
+    except ValueError as error:
+        sys.exit(f"[PHONEBRUTE] Kept the current database, the new report was rejected: {error}")
+    if changes is None:
+        print("[PHONEBRUTE] The database is already up to date")
+    else:
+        print(f"[PHONEBRUTE] {changes['added']} blocks added, {changes['removed']} removed, "
+              f"{changes['changed']} changed, {changes['unchanged']} unchanged")
+
+
+COMMANDS = {
+    'batch' : run_batch,
+    'annotate' : run_annotate,
+    'validate' : run_validate,
+    'serve' : run_serve,
+    'update' : run_update
+}
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] in COMMANDS:
+        COMMANDS[argv[0]](argv[1:])
     else:
-        lightning_search.export_to_json(valid_numbers, args.output)
+        run_search(parser.parse_args(argv))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+# Stage Profiler
+# Wall time, peak RSS and rows in/out for every stage of a search
+import sys
+import json
+import time
+import contextlib
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, peak RSS is reported as None there
+    resource = None
+
+# Stages of the phonebrute pipeline, in the order they run
+STAGES = ('download', 'load', 'match', 'filter', 'rank', 'expand', 'render', 'count', 'stream', 'export', 'remote')
+
+FORMATS = ('table', 'json')
+
+
+def peak_rss() -> int:
+    """
+    Peak resident set size of this process so far in bytes, None if unknown
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class StageProfiler:
+    """
+    Collects one record per stage. Pass one to LightningSearch (or
+    lightning_searcher.search) and read it back with records, table() or
+    to_json() once the search is done.
+    """
+
+    def __init__(self):
+        self.records = []
+        # Names of the stages running right now, outermost first
+        self._running = []
+
+    @contextlib.contextmanager
+    def stage(self, name, rows_in=None):
+        """Time a stage
+
+        A stage started while another one runs (ex: rank while render pulls
+        the ranked numbers) is recorded with that stage as its parent, and
+        left out of total_seconds since its parent's time already has it.
+
+        Args:
+            name (str): stage name, see STAGES
+            rows_in (int, optional): rows going into the stage
+
+        Yields:
+            dict: the record, set its 'rows_out' inside the block
+        """
+        record = {'stage': name, 'parent': self._running[-1] if self._running else None,
+                  'seconds': None, 'peak_rss': None, 'rows_in': rows_in, 'rows_out': None}
+        self._running.append(name)
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['seconds'] = time.perf_counter() - start
+            record['peak_rss'] = peak_rss()
+            self._running.pop()
+            self.records.append(record)
+
+    def total_seconds(self) -> float:
+        """
+        Wall time of the top level stages, nested ones are part of their parent's
+        """
+        return sum(record['seconds'] for record in self.records if record['parent'] is None)
+
+    def table(self) -> str:
+        """
+        The records as a table for the terminal
+        """
+        from tabulate import tabulate
+
+        rows = [[record['stage'] if record['parent'] is None else f"{record['stage']} (in {record['parent']})",
+                 record['seconds'],
+                 None if record['peak_rss'] is None else record['peak_rss'] / 2 ** 20,
+                 record['rows_in'], record['rows_out']] for record in self.records]
+        rows.append(['total', self.total_seconds(), None, None, None])
+        return tabulate(rows, headers=['stage', 'seconds', 'peak RSS MiB', 'rows in', 'rows out'],
+                        tablefmt='pipe', floatfmt='.4f', missingval='')
+
+    def to_json(self) -> str:
+        """
+        The records as JSON, with peak RSS in bytes
+        """
+        return json.dumps({'stages': self.records, 'total_seconds': self.total_seconds()})
+
+    def report(self, output_format='table', stream=None):
+        """Print the records
+
+        Args:
+            output_format (str, optional): table or json
+            stream (file, optional): where to print. Defaults to stderr, so
+            the report doesn't mix with results streamed to stdout.
+        """
+        stream = stream or sys.stderr
+        print(self.to_json() if output_format == 'json' else self.table(), file=stream)
+
+
+def stage(profiler, name, rows_in=None):
+    """Time a stage if there is a profiler, do nothing otherwise
+
+    Args:
+        profiler (StageProfiler): the profiler, or None
+        name (str): stage name, see STAGES
+        rows_in (int, optional): rows going into the stage
+
+    Returns:
+        context manager yielding the record (a throwaway dict without a profiler)
+    """
+    if profiler is None:
+        return contextlib.nullcontext({})
+    return profiler.stage(name, rows_in)
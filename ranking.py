@@ -0,0 +1,120 @@
+# Ranking
+# Score blocks by how plausible their numbers are, and hand them out best
+# first without sorting every block
+import numpy as np
+
+# How much every signal adds to a block's score, each signal is 0 to 1
+WEIGHTS = {
+    'status' : 4.0,
+    'age' : 2.0,
+    'carrier' : 1.0,
+    'contaminated' : -3.0,
+    'tn_not_available' : -2.0
+}
+
+# Blocks assigned this many years before the newest date in the report get
+# the full age score, newer ones a share of it
+FULL_AGE_YEARS = 10.0
+
+# Blocks in the first batch handed out, every batch after is 4 times bigger
+FIRST_BATCH = 64
+
+
+def date_years(dictionary) -> np.ndarray:
+    """Turn a dictionary of MM/DD/YYYY dates into fractional years
+
+    Args:
+        dictionary (list): date strings of a text column
+
+    Returns:
+        np.ndarray: years indexed by code, NaN for anything that isn't a date;
+        the last entry is NaN so a stored -1 (missing) maps to it
+    """
+    years = np.full(len(dictionary) + 1, np.nan)
+    for code, text in enumerate(dictionary):
+        month, _, rest = text.partition('/')
+        day, _, year = rest.partition('/')
+        if month.isdigit() and day.isdigit() and year.isdigit():
+            years[code] = int(year) + (int(month) - 1) / 12 + (int(day) - 1) / 365
+    return years
+
+
+def block_scores(blocks, rows, weights=None) -> np.ndarray:
+    """Score some blocks by the signals in the report
+
+    A block scores higher when it is assigned (status AS), has been in
+    service for longer (date assigned, or else block effective date,
+    compared to the newest date in the report; older blocks have had more
+    time to fill up), and belongs to a carrier holding many blocks. It
+    scores lower when contaminated or when its numbers are marked not
+    available.
+
+    Args:
+        blocks (db_cache.BlockTable): the table
+        rows (np.ndarray): row positions into blocks
+        weights (dict, optional): weight of every signal, see WEIGHTS
+
+    Returns:
+        np.ndarray: float score of every row
+    """
+    weights = dict(WEIGHTS, **(weights or {}))
+    columns = blocks.columns
+    scores = np.zeros(len(rows))
+
+    def flag(column, value):
+        code = blocks.code_of(column, value)
+        return np.zeros(len(rows)) if code is None else (columns[column][rows] == code).astype(float)
+
+    scores += weights['status'] * flag('status', 'AS')
+    scores += weights['contaminated'] * flag('contaminated', 'Y')
+    scores += weights['tn_not_available'] * flag('tn_not_available', 'Y')
+
+    assigned_years = date_years(blocks.dictionaries['date_assigned'])
+    effective_years = date_years(blocks.dictionaries['block_effective_date'])
+    newest = np.nanmax(np.concatenate((assigned_years, effective_years, [-np.inf])))
+    years = assigned_years[columns['date_assigned'][rows]]
+    years = np.where(np.isnan(years), effective_years[columns['block_effective_date'][rows]], years)
+    age = np.clip((newest - years) / FULL_AGE_YEARS, 0, 1)
+    scores += weights['age'] * np.nan_to_num(age)
+
+    # Blocks held by the carrier over the whole report, on a log scale;
+    # missing carriers (-1) land in the trailing slot and score 0
+    carriers = len(blocks.dictionaries['carrier'])
+    held = np.bincount(columns['carrier'].astype(np.int64) % (carriers + 1), minlength=carriers + 1)
+    held[-1] = 0
+    share = np.log1p(held) / np.log1p(max(int(held.max()), 1))
+    scores += weights['carrier'] * share[columns['carrier'][rows]]
+    return scores
+
+
+def ranked_batches(scores, first_batch=FIRST_BATCH):
+    """Hand out positions of scores best first, a growing batch at a time
+
+    Every batch only takes a partition of what is left, and sorts just
+    itself, so the first batches come out right away and a caller that
+    stops early never pays for sorting the rest. Equal scores come out in
+    position order.
+
+    Args:
+        scores (np.ndarray): score of every position
+        first_batch (int, optional): size of the first batch
+
+    Yields:
+        np.ndarray: positions into scores, best first
+    """
+    remaining = np.arange(len(scores))
+    size = first_batch
+    while len(remaining):
+        keys = -scores[remaining]
+        if len(remaining) > size:
+            # Everything better than the size-th best key, then ties in position order
+            kth = np.partition(keys, size - 1)[size - 1]
+            take = keys < kth
+            ties = np.flatnonzero(keys == kth)[:size - np.count_nonzero(take)]
+            take[ties] = True
+        else:
+            take = np.ones(len(remaining), dtype=bool)
+        batch = remaining[take]
+        remaining = remaining[~take]
+        yield batch[np.lexsort((batch, -scores[batch]))]
+        size *= 4
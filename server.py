@@ -0,0 +1,184 @@
+# Query Server
+# Keep the database resident and answer searches over HTTP or a Unix socket
+import io
+import json
+import socketserver
+import urllib.parse
+import http.server
+import db_cache
+import filters
+import lightning_searcher
+import streaming
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8642
+
+CONTENT_TYPES = {
+    'csv' : 'text/csv; charset=utf-8',
+    'jsonl' : 'application/x-ndjson; charset=utf-8',
+    'txt' : 'text/plain; charset=utf-8'
+}
+
+
+def _param(params, name, default=None):
+    # Single-valued parameters take their last value
+    return params[name][-1] if name in params else default
+
+
+def _flag(value) -> bool:
+    return value.lower() in ('1', 'true', 'yes')
+
+
+class SearchHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Answers GET /health, /search, /count and /summary. Every response closes the
+    connection, so results can be streamed without a content length.
+    """
+
+    server_version = 'Phonebrute'
+    protocol_version = 'HTTP/1.0'
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        params = urllib.parse.parse_qs(url.query)
+        route = self.routes.get(url.path)
+        if route is None:
+            self.send_json(404, {'error': f"Unknown path {url.path}"})
+            return
+        try:
+            route(self, params)
+        except (KeyError, ValueError) as error:
+            self.send_json(400, {'error': str(error)})
+
+    def send_json(self, status, data):
+        """Send a small JSON response
+
+        Args:
+            status (int): HTTP status
+            data (dict): response body
+        """
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def start_search(self, params):
+        """Run the search described by the query parameters
+
+        Args:
+            params (dict): query parameter -> list of values, number is required
+
+        Returns:
+            lightning_searcher.LightningSearch: the search
+        """
+        if 'number' not in params:
+            raise KeyError("Missing the number parameter")
+        column_filters = filters.from_options(params, _param(params, 'match', 'regex'))
+        return lightning_searcher.search(_param(params, 'number'),
+                                         include_contaminated=_flag(_param(params, 'include_contaminated', '0')),
+                                         filters=column_filters, blocks=self.server.blocks)
+
+    def health(self, params):
+        self.send_json(200, {'status': 'ok', 'blocks': len(self.server.blocks)})
+
+    def search(self, params):
+        output_format = _param(params, 'format', 'jsonl')
+        if output_format not in streaming.WRITERS:
+            raise ValueError(f"Unknown format {output_format}, use one of {', '.join(streaming.WRITERS)}")
+        top = _param(params, 'top')
+        top = None if top is None else int(top)
+        if top is not None and top < 1:
+            raise ValueError("top needs a positive number of results")
+        # Search before sending anything so a bad pattern can still get a 400
+        lightning_search = self.start_search(params)
+
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPES[output_format])
+        self.end_headers()
+        stream = io.TextIOWrapper(self.wfile, encoding='utf-8', newline='', write_through=True)
+        try:
+            lightning_search.write_stream(stream, output_format, top=top)
+        except ConnectionError:
+            # The client stopped reading, ex: it only wanted the first page
+            pass
+        finally:
+            stream.detach()
+
+    def count(self, params):
+        self.send_json(200, self.start_search(params).count_results())
+
+    def summary(self, params):
+        self.send_json(200, self.start_search(params).summarize_exchanges())
+
+    routes = {
+        '/health' : health,
+        '/search' : search,
+        '/count' : count,
+        '/summary' : summary
+    }
+
+    def address_string(self):
+        # Unix socket clients have no address
+        if isinstance(self.client_address, tuple):
+            return self.client_address[0]
+        return 'unix'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class SearchServer(http.server.ThreadingHTTPServer):
+    """
+    HTTP server holding one shared, read-only BlockTable
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, blocks, verbose=False):
+        self.blocks = blocks
+        self.verbose = verbose
+        super().__init__(address, SearchHandler)
+
+
+class UnixSearchServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    SearchServer listening on a Unix socket instead of a TCP port
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path, blocks, verbose=False):
+        self.blocks = blocks
+        self.verbose = verbose
+        super().__init__(path, SearchHandler)
+
+
+def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, socket_path=None, datafile='./phone_numbers.csv',
+          verbose=False):
+    """Load the database once and answer searches until interrupted
+
+    Args:
+        host (str, optional): address to listen on
+        port (int, optional): port to listen on
+        socket_path (str, optional): listen on this Unix socket instead of host/port
+        datafile (str, optional): path to phone_numbers.csv
+        verbose (bool, optional): log every request
+    """
+    blocks = db_cache.load_cache(datafile)
+    # Build the index up front so the first request doesn't pay for it
+    blocks.index
+
+    if socket_path:
+        server = UnixSearchServer(socket_path, blocks, verbose)
+        print(f"[PHONEBRUTE] Serving {len(blocks)} blocks on unix://{socket_path}")
+    else:
+        server = SearchServer((host, port), blocks, verbose)
+        print(f"[PHONEBRUTE] Serving {len(blocks)} blocks on http://{host}:{port}")
+    with server:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,321 @@
+# Streaming Writers
+# Write generated numbers chunk by chunk instead of holding one big table
+import io
+import os
+import sys
+import csv
+import json
+
+# Numbers generated per chunk when streaming
+CHUNK_SIZE = 250000
+
+
+class StreamWriter:
+    """
+    Base class for streaming writers. Every generated number belongs to
+    a row of the block table, and all numbers of a row share the same
+    columns, so each row is rendered once as the text that goes before
+    and after its numbers.
+    """
+
+    def __init__(self, stream, blocks, columns, tag=None, header=True):
+        """
+        Args:
+            stream (file): text stream to write to
+            blocks (db_cache.BlockTable): table the rows refer to
+            columns (list): columns to write after the phone number
+            tag (str, optional): pattern to write in front of every number
+            header (bool, optional): write the header, if the format has one
+        """
+        self.stream = stream
+        self.blocks = blocks
+        self.columns = columns
+        self.tag = tag
+        self.header = header
+        self.count = 0
+        self._affixes = {}
+        # Affix arrays of write_scattered, built on first use
+        self._scattered = None
+
+    def value_text(self, value) -> str:
+        """Render a single column value
+
+        Args:
+            value (str): the value, None if missing
+
+        Returns:
+            str: the value as it appears in the output
+        """
+        return '' if value is None else value
+
+    def number_text(self, text) -> str:
+        """Render text that isn't a phone number in the place of one, so it
+        can't break the line it is written into
+
+        Args:
+            text (str): the text, ex: a line that didn't parse as a number
+
+        Returns:
+            str: the text as it appears in the output
+        """
+        return text
+
+    def column_texts(self, column, rows):
+        """Render a column for several rows, each distinct value only once
+
+        Args:
+            column (str): column name
+            rows (np.ndarray): row positions into the block table, negative
+            for no row (rendered as missing)
+
+        Returns:
+            np.ndarray: object array of rendered values, one per row
+        """
+        import numpy as np
+
+        codes = self.blocks.columns[column][np.maximum(rows, 0)].astype(np.int64)
+        # A stored -1 decodes to None through the decoder's trailing entry
+        codes[rows < 0] = -1
+        unique_codes, inverse = np.unique(codes, return_inverse=True)
+        values = self.blocks.decoder(column)[unique_codes]
+        texts = np.array([self.value_text(value) for value in values], dtype=object)
+        return texts[inverse]
+
+    def rows_affixes(self, rows) -> tuple:
+        """Render the text around the numbers of several rows
+
+        Args:
+            rows (np.ndarray): row positions into the block table, negative
+            for no row
+
+        Returns:
+            tuple: object arrays (text before each number, text after each number)
+        """
+        import numpy as np
+
+        return np.full(len(rows), '', dtype=object), np.full(len(rows), '', dtype=object)
+
+    def row_affixes(self, row) -> tuple:
+        """Render the text around the numbers of a row
+
+        Args:
+            row (int): row position into the block table
+
+        Returns:
+            tuple: (text before each number, text after each number)
+        """
+        import numpy as np
+
+        befores, afters = self.rows_affixes(np.array([row]))
+        return befores[0], afters[0]
+
+    def write_header(self):
+        """
+        Write anything that goes before the first number
+        """
+
+    def write(self, numbers, number_rows):
+        """Write a chunk of numbers
+
+        Args:
+            numbers (list): 10 digit phone numbers as strings
+            number_rows (np.ndarray): block row of each number, in runs
+        """
+        # Only needed once there is something to write, so a client that just
+        # picks a format doesn't pay for numpy
+        import numpy as np
+
+        if self.header:
+            self.write_header()
+            self.header = False
+        if len(numbers) == 0:
+            return
+
+        # Numbers of the same row come in runs, join each run in one go
+        boundaries = np.flatnonzero(np.diff(number_rows)) + 1
+        starts = np.concatenate(([0], boundaries))
+        stops = np.concatenate((boundaries, [len(numbers)]))
+        run_rows = number_rows[starts].tolist()
+        # Render the rows seen for the first time all together
+        new_rows = [row for row in dict.fromkeys(run_rows) if row not in self._affixes]
+        if new_rows:
+            befores, afters = self.rows_affixes(np.array(new_rows))
+            self._affixes.update(zip(new_rows, zip(befores.tolist(), afters.tolist())))
+        parts = []
+        for start, stop, row in zip(starts.tolist(), stops.tolist(), run_rows):
+            before, after = self._affixes[row]
+            separator = after + '\n' + before
+            parts.append(before + separator.join(numbers[start:stop]) + after + '\n')
+        self.stream.write(''.join(parts))
+        self.count += len(numbers)
+
+    def write_scattered(self, numbers, number_rows):
+        """Write a chunk of numbers whose rows are in no particular order
+
+        Args:
+            numbers (np.ndarray): phone numbers as an object array, anything
+            else has to go through number_text first
+            number_rows (np.ndarray): block row of each number, -1 for none
+        """
+        import numpy as np
+
+        if self.header:
+            self.write_header()
+            self.header = False
+        if len(numbers) == 0:
+            return
+
+        if self._scattered is None:
+            # Affixes by row and whether they are rendered yet, with a last
+            # slot for row -1
+            self._scattered = (np.full(len(self.blocks) + 1, None, dtype=object),
+                               np.full(len(self.blocks) + 1, None, dtype=object),
+                               np.zeros(len(self.blocks) + 1, dtype=bool))
+        befores, afters, rendered = self._scattered
+
+        # Render the rows seen for the first time all together, then put
+        # every line together in one pass
+        new_rows = np.unique(number_rows[~rendered[number_rows]])
+        if len(new_rows):
+            befores[new_rows], afters[new_rows] = self.rows_affixes(new_rows)
+            afters[new_rows] += '\n'
+            rendered[new_rows] = True
+        # Interleave the pieces and join them once, rather than adding strings
+        parts = np.empty(3 * len(numbers), dtype=object)
+        parts[0::3] = befores[number_rows]
+        parts[1::3] = numbers
+        parts[2::3] = afters[number_rows]
+        self.stream.write(''.join(parts.tolist()))
+        self.count += len(numbers)
+
+    def close(self):
+        """
+        Write anything that goes after the last number
+        """
+        if self.header:
+            self.write_header()
+            self.header = False
+        self.stream.flush()
+
+
+class TextStreamWriter(StreamWriter):
+    """
+    One bare phone number per line, after the tag and a tab if tagged
+    """
+
+    def rows_affixes(self, rows):
+        befores, afters = super().rows_affixes(rows)
+        if self.tag is not None:
+            befores[:] = self.tag + '\t'
+        return befores, afters
+
+
+class CsvStreamWriter(StreamWriter):
+    """
+    CSV with a header row, missing values left empty
+    """
+
+    def _csv_line(self, values):
+        line = io.StringIO()
+        csv.writer(line, lineterminator='').writerow(values)
+        return line.getvalue()
+
+    def value_text(self, value):
+        # On its own, an empty string would be quoted to tell it from no field
+        return self._csv_line([value]) if value else ''
+
+    def number_text(self, text):
+        return self.value_text(text)
+
+    def write_header(self):
+        tag_header = ['Pattern'] if self.tag is not None else []
+        self.stream.write(self._csv_line(tag_header + ['Phone Number'] + self.columns) + '\n')
+
+    def rows_affixes(self, rows):
+        befores, afters = super().rows_affixes(rows)
+        if self.tag is not None:
+            befores[:] = self._csv_line([self.tag]) + ','
+        for column in self.columns:
+            afters += ','
+            afters += self.column_texts(column, rows)
+        return befores, afters
+
+
+class JsonLinesStreamWriter(StreamWriter):
+    """
+    One JSON object per line, missing values as null
+    """
+
+    def value_text(self, value):
+        return json.dumps(value)
+
+    def number_text(self, text):
+        # The number sits between quotes already
+        return json.dumps(text)[1:-1]
+
+    def rows_affixes(self, rows):
+        befores, afters = super().rows_affixes(rows)
+        befores[:] = '{"Phone Number": "'
+        if self.tag is not None:
+            befores[:] = '{"Pattern": ' + json.dumps(self.tag) + ', "Phone Number": "'
+        afters[:] = '"'
+        for column in self.columns:
+            afters += ', ' + json.dumps(column) + ': '
+            afters += self.column_texts(column, rows)
+        afters += '}'
+        return befores, afters
+
+
+WRITERS = {
+    'csv' : CsvStreamWriter,
+    'jsonl' : JsonLinesStreamWriter,
+    'txt' : TextStreamWriter
+}
+
+EXTENSIONS = {
+    '.csv' : 'csv',
+    '.json' : 'jsonl',
+    '.jsonl' : 'jsonl',
+    '.ndjson' : 'jsonl',
+    '.txt' : 'txt'
+}
+
+
+def format_for_path(path, default=None) -> str:
+    """Guess the stream format from a file name
+
+    A .json file gets json lines, as a stream can't be one json array.
+
+    Args:
+        path (str): output path, '-' for stdout (bare numbers)
+        default (str, optional): format to use when the extension is unknown
+
+    Raises:
+        ValueError: if the extension is unknown and there is no default
+
+    Returns:
+        str: one of WRITERS
+    """
+    if path == '-':
+        return 'txt'
+    extension = os.path.splitext(path)[1].lower()
+    if extension in EXTENSIONS:
+        return EXTENSIONS[extension]
+    if default is None:
+        raise ValueError(f"Can't tell the output format of {path!r}, use one of "
+                         f"{', '.join(EXTENSIONS)} or pick it with -f")
+    return default
+
+
+def open_output(path):
+    """Open an output path for streaming
+
+    Args:
+        path (str): file to write to, '-' for stdout
+
+    Returns:
+        file: text stream, stdout is returned as-is
+    """
+    if path == '-':
+        return sys.stdout
+    return open(path, 'w', encoding='utf-8', newline='')
@@ -0,0 +1,162 @@
+# Synthetic Data
+# Generate a fake AllBlocksAugmentedReport shaped like the real one, for
+# benchmarks and offline testing
+import argparse
+import numpy as np
+import pandas as pd
+
+HEADER = ['Region', 'State', 'NPA', 'NXX', 'X', 'Status', 'Code Holder', 'Contaminated',
+          'TN Not Available', 'Rate Center', 'Block Effective Date', 'Block Available Date',
+          'OCN Name', 'OCN', 'Date Assigned']
+
+# Rough share of NPAs per state, so big states get more area codes
+STATE_WEIGHTS = {
+    'CA': 38, 'TX': 28, 'FL': 20, 'NY': 20, 'PA': 13, 'IL': 13, 'OH': 12, 'GA': 10, 'NC': 10,
+    'MI': 10, 'NJ': 9, 'VA': 8, 'WA': 7, 'AZ': 7, 'MA': 7, 'TN': 7, 'IN': 7, 'MO': 6, 'MD': 6,
+    'WI': 6, 'CO': 6, 'MN': 6, 'SC': 5, 'AL': 5, 'LA': 5, 'KY': 4, 'OR': 4, 'OK': 4, 'CT': 4,
+    'UT': 3, 'IA': 3, 'NV': 3, 'AR': 3, 'MS': 3, 'KS': 3, 'NM': 2, 'NE': 2, 'ID': 2, 'WV': 2,
+    'HI': 1, 'NH': 1, 'ME': 1, 'MT': 1, 'RI': 1, 'DE': 1, 'SD': 1, 'ND': 1, 'AK': 1, 'DC': 1,
+    'VT': 1, 'WY': 1, 'PR': 1
+}
+
+REGIONS = ['NORTHEAST', 'MIDATLANTIC', 'SOUTHEAST', 'MIDWEST', 'SOUTHWEST', 'WESTERN', 'WEST COAST']
+
+# The handful of carriers holding most blocks, the rest are generated
+MAJOR_CARRIERS = ['CELLCO PARTNERSHIP DBA VERIZON WIRELESS', 'NEW CINGULAR WIRELESS PCS, LLC - IL',
+                  'T-MOBILE USA, INC.', 'LEVEL 3 COMMUNICATIONS, LLC', 'BANDWIDTH.COM CLEC, LLC',
+                  'ONVOY, LLC', 'PACIFIC BELL', 'SPRINT SPECTRUM L.P.', 'CENTURYLINK COMMUNICATIONS',
+                  'FRONTIER COMMUNICATIONS']
+CARRIER_SUFFIXES = ['TELEPHONE CO.', 'WIRELESS, LLC', 'COMMUNICATIONS, INC.', 'TEL. CO-OP', 'CLEC, LLC',
+                    'BROADBAND', 'MOBILITY LLC', 'NETWORKS, INC.']
+SYLLABLES = ['AL', 'BEN', 'CAR', 'DEL', 'ELK', 'FAR', 'GRAN', 'HAR', 'IRON', 'JEF', 'KEN', 'LIN',
+             'MAR', 'NOR', 'OAK', 'PINE', 'QUIN', 'RIV', 'SAL', 'TAY', 'UNI', 'VAL', 'WIL', 'YOR']
+
+# Shape of the real report at scale 1
+NPAS = 330
+CARRIERS = 1500
+EXCHANGES_PER_NPA = (60, 420)
+RATE_CENTERS_PER_NPA = (10, 110)
+ASSIGNED_SHARE = 0.72
+CONTAMINATED_SHARE = 0.18
+TN_NOT_AVAILABLE_SHARE = 0.04
+
+
+def _names(rng, count, suffixes=None) -> np.ndarray:
+    # Two or three syllables, plus an optional suffix
+    first = rng.choice(SYLLABLES, count)
+    second = rng.choice(SYLLABLES, count)
+    third = np.where(rng.random(count) < 0.5, rng.choice(SYLLABLES, count), '')
+    names = np.char.add(np.char.add(first, np.char.lower(second)), np.char.lower(third))
+    names = np.char.upper(names)
+    if suffixes is not None:
+        names = np.char.add(np.char.add(names, ' '), rng.choice(suffixes, count))
+    return names
+
+
+def _dates(rng, count) -> np.ndarray:
+    days = rng.integers(np.datetime64('2002-01-01').astype(int), np.datetime64('2024-12-31').astype(int), count)
+    return pd.to_datetime(days, unit='D').strftime('%m/%d/%Y').to_numpy()
+
+
+def _without_n11(values) -> np.ndarray:
+    # N11 codes (211, 311, ... 911) are never assigned
+    return values[values % 100 != 11]
+
+
+def generate_report(scale=1.0, seed=0) -> pd.DataFrame:
+    """Generate a synthetic report
+
+    Args:
+        scale (float, optional): size relative to the real report, which
+        has roughly 330 pooled NPAs, 80,000 exchanges and 800,000 blocks
+        seed (int, optional): random seed, the same seed gives the same report
+
+    Returns:
+        pd.DataFrame: report with HEADER as columns, all strings
+    """
+    rng = np.random.default_rng(seed)
+
+    # Area codes, each in one state
+    npa_count = max(1, int(round(NPAS * scale)))
+    npas = np.sort(rng.choice(_without_n11(np.arange(201, 990)), npa_count, replace=False))
+    states = np.array(list(STATE_WEIGHTS))
+    weights = np.array(list(STATE_WEIGHTS.values()), dtype=float)
+    npa_states = rng.choice(states, npa_count, p=weights / weights.sum())
+    state_regions = {state: REGIONS[i % len(REGIONS)] for i, state in enumerate(states)}
+
+    # Carriers, with a long tail of small ones
+    carrier_names = np.concatenate((MAJOR_CARRIERS, _names(rng, CARRIERS - len(MAJOR_CARRIERS), CARRIER_SUFFIXES)))
+    carrier_weights = 1.0 / np.arange(1, CARRIERS + 1) ** 1.1
+    carrier_weights /= carrier_weights.sum()
+    carrier_ocns = np.char.add(rng.choice(list('0123456789'), CARRIERS),
+                               np.char.zfill(rng.integers(0, 999, CARRIERS).astype(str), 3))
+
+    # Exchanges of every area code, each in one of the area code's rate centers
+    exchange_npa, exchange_nxx, exchange_rc, exchange_holder = [], [], [], []
+    nxx_pool = _without_n11(np.arange(200, 1000))
+    for i in range(npa_count):
+        exchanges = min(len(nxx_pool), rng.integers(*EXCHANGES_PER_NPA))
+        rate_centers = _names(rng, rng.integers(*RATE_CENTERS_PER_NPA))
+        exchange_npa.append(np.full(exchanges, npas[i]))
+        exchange_nxx.append(np.sort(rng.choice(nxx_pool, exchanges, replace=False)))
+        exchange_rc.append(rng.choice(rate_centers, exchanges))
+        exchange_holder.append(rng.choice(CARRIERS, exchanges, p=carrier_weights))
+    exchange_npa = np.concatenate(exchange_npa)
+    exchange_nxx = np.concatenate(exchange_nxx)
+    exchange_rc = np.concatenate(exchange_rc)
+    exchange_holder = np.concatenate(exchange_holder)
+
+    # Ten thousands blocks per exchange
+    blocks = len(exchange_npa) * 10
+    exchange = np.repeat(np.arange(len(exchange_npa)), 10)
+    x = np.tile(np.arange(10), len(exchange_npa))
+    assigned = rng.random(blocks) < ASSIGNED_SHARE
+    # Most blocks stay with the code holder, the rest are pooled out to others
+    pooled = rng.random(blocks) < 0.35
+    block_holder = np.where(pooled, rng.choice(CARRIERS, blocks, p=carrier_weights), exchange_holder[exchange])
+    npa_index = np.searchsorted(npas, exchange_npa[exchange])
+    block_states = npa_states[npa_index]
+    none = np.full(blocks, 'NONE', dtype=object)
+
+    return pd.DataFrame({
+        'Region' : [state_regions[state] for state in block_states],
+        'State' : block_states,
+        'NPA' : exchange_npa[exchange].astype(str),
+        'NXX' : np.char.zfill(exchange_nxx[exchange].astype(str), 3),
+        'X' : x.astype(str),
+        'Status' : np.where(assigned, 'AS', 'AV'),
+        'Code Holder' : carrier_names[exchange_holder[exchange]],
+        'Contaminated' : np.where(rng.random(blocks) < CONTAMINATED_SHARE, 'Y', 'N'),
+        'TN Not Available' : np.where(rng.random(blocks) < TN_NOT_AVAILABLE_SHARE, 'Y', 'N'),
+        'Rate Center' : exchange_rc[exchange],
+        'Block Effective Date' : np.where(assigned, _dates(rng, blocks), none),
+        'Block Available Date' : np.where(assigned, none, _dates(rng, blocks)),
+        'OCN Name' : np.where(assigned, carrier_names[block_holder], none),
+        'OCN' : np.where(assigned, carrier_ocns[block_holder], none),
+        'Date Assigned' : np.where(assigned, _dates(rng, blocks), none)
+    }, columns=HEADER)
+
+
+def write_report(path, scale=1.0, seed=0) -> int:
+    """Generate a synthetic report and write it where phone_numbers.csv would be
+
+    Args:
+        path (str): file to write
+        scale (float, optional): size relative to the real report
+        seed (int, optional): random seed
+
+    Returns:
+        int: number of blocks written
+    """
+    report = generate_report(scale, seed)
+    report.to_csv(path, index=False)
+    return len(report)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate a synthetic AllBlocksAugmentedReport')
+    parser.add_argument("OUTPUT", help="File to write, ex: phone_numbers.csv")
+    parser.add_argument("--scale", type=float, default=1.0, help="Size relative to the real report")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    args = parser.parse_args()
+    print(f"Wrote {write_report(args.OUTPUT, args.scale, args.seed)} blocks to {args.OUTPUT}")
@@ -0,0 +1,62 @@
+# Shared fixtures: synthetic reports and the caches built from them
+import os
+import sys
+import re
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db_cache
+import synthetic_data
+
+
+def pattern_regex(pattern):
+    """Translate a digit pattern into the equivalent Python regex, the reference every test checks against
+
+    Args:
+        pattern (str): pattern ex: 312[2-5]XXXXXX or (312|773)555XXXX
+
+    Returns:
+        re.Pattern: regex to fullmatch zero-padded numbers with
+    """
+    return re.compile(pattern.replace('X', '[0-9]'))
+
+
+@pytest.fixture(scope='session')
+def report(tmp_path_factory):
+    """
+    Path of a synthetic report written the way phonebrute.py finds phone_numbers.csv
+    """
+    path = str(tmp_path_factory.mktemp('report') / 'phone_numbers.csv')
+    synthetic_data.write_report(path, scale=0.01, seed=1)
+    return path
+
+
+@pytest.fixture(scope='session')
+def blocks(report):
+    """
+    Cache of the synthetic report
+    """
+    return db_cache.load_cache(report)
+
+
+@pytest.fixture(scope='session')
+def small_blocks(tmp_path_factory):
+    """
+    Cache of a report small enough to check number by number: a few
+    exchanges of two area codes, plus two blocks without a thousands digit
+    that cover a whole exchange each
+    """
+    import pandas as pd
+
+    first = synthetic_data.generate_report(scale=0.002, seed=1)
+    second = synthetic_data.generate_report(scale=0.002, seed=2)
+    frame = pd.concat([first[:150], second[:150]], ignore_index=True)
+    whole = frame.iloc[[0, 150]].copy()
+    whole['NXX'] = ['999', '998']
+    whole['X'] = 'NONE'
+    frame = pd.concat([frame, whole], ignore_index=True)
+
+    path = str(tmp_path_factory.mktemp('small') / 'phone_numbers.csv')
+    frame.to_csv(path, index=False)
+    return db_cache.load_cache(path)
@@ -0,0 +1,43 @@
+# Annotating full numbers: input order, formats that stay parseable whatever the input
+import csv
+import json
+
+import annotate
+
+
+def write_lines(path, lines):
+    with open(path, 'w', encoding='utf-8') as infile:
+        infile.write('\n'.join(lines) + '\n')
+
+
+def sample_lines(blocks):
+    number = f"{blocks.decode('NPA')[0]}{blocks.decode('NXX')[0]}{blocks.decode('x')[0]}123"
+    formatted = f"+1 ({number[:3]}) {number[3:6]}-{number[6:]}"
+    return [number, 'foo"bar\\', 'x,y', formatted, '0000000000', '"quoted"']
+
+
+def test_csv_rows_keep_their_shape(blocks, tmp_path):
+    lines = sample_lines(blocks)
+    write_lines(tmp_path / 'in.txt', lines)
+    output = str(tmp_path / 'out.csv')
+    read, found = annotate.run_annotate(str(tmp_path / 'in.txt'), output, blocks=blocks)
+
+    with open(output, newline='', encoding='utf-8') as result:
+        rows = list(csv.reader(result))
+    assert all(len(row) == len(annotate.ANNOTATE_COLUMNS) + 1 for row in rows)
+    assert [row[0] for row in rows[1:]] == lines[:3] + [lines[0]] + lines[4:]
+    assert (read, found) == (len(lines), 2)
+    assert rows[1][1:] == rows[4][1:] != [''] * len(annotate.ANNOTATE_COLUMNS)
+
+
+def test_jsonl_lines_parse(blocks, tmp_path):
+    lines = sample_lines(blocks)
+    write_lines(tmp_path / 'in.txt', lines)
+    output = str(tmp_path / 'out.jsonl')
+    annotate.run_annotate(str(tmp_path / 'in.txt'), output, blocks=blocks)
+
+    with open(output, encoding='utf-8') as result:
+        records = [json.loads(line) for line in result]
+    assert [record['Phone Number'] for record in records] == lines[:3] + [lines[0]] + lines[4:]
+    assert records[1]['state'] is None
+    assert records[0]['state'] == blocks.decode('state')[0]
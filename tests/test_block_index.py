@@ -0,0 +1,102 @@
+# Index lookups and block-aware expansion, checked number by number against regexes
+import numpy as np
+import pytest
+
+import block_index
+import lightning_searcher
+from conftest import pattern_regex
+
+
+def block_numbers(blocks, row):
+    # Every number a row holds: its thousands block, or the whole exchange when x is -1
+    exchange = int(blocks.columns['NPA'][row]) * 1000 + int(blocks.columns['NXX'][row])
+    x = int(blocks.columns['x'][row])
+    if x < 0:
+        return exchange * 10000 + np.arange(10000)
+    return (exchange * 10 + x) * 1000 + np.arange(1000)
+
+
+def reference(blocks, pattern):
+    """
+    (rows holding at least one match, every matching number with its row), by brute force
+    """
+    regex = pattern_regex(pattern)
+    rows, numbers, number_rows = [], [], []
+    for row in range(len(blocks)):
+        matched = [number for number in block_numbers(blocks, row).tolist() if regex.fullmatch(f"{number:010d}")]
+        if matched:
+            rows.append(row)
+            numbers += matched
+            number_rows += [row] * len(matched)
+    return rows, numbers, number_rows
+
+
+def small_patterns(blocks):
+    # Patterns around the exchanges of the small report, so every one has results
+    npas = sorted(set(blocks.decode('NPA').tolist()))
+    first, second = npas[0], npas[1]
+    nxx = blocks.decode('NXX')[0]
+    return [
+        f"{first}{nxx}XXXX",
+        f"{first}{nxx}[2-5]XXX",
+        f"{first}XXXXXXX",
+        f"{first}[^2]XXXXXX",
+        f"({first}|{second})2[0-1]XXX55",
+        f"{first}{nxx}1XXX|{second}XXX[^0]XX9",
+        f"{second}99[89]X0X0",
+        "XXXXXXX555",
+        "XXX20[13579]XXXX"
+    ]
+
+
+@pytest.fixture(scope='module')
+def cases(small_blocks):
+    return {pattern: reference(small_blocks, pattern) for pattern in small_patterns(small_blocks)}
+
+
+def test_whole_exchange_rows_are_present(small_blocks):
+    assert (small_blocks.columns['x'] < 0).sum() == 2
+
+
+def test_lookup_matches_brute_force(small_blocks, cases):
+    for pattern, (rows, _, _) in cases.items():
+        search = lightning_searcher.LightningSearch(pattern, print_data=False, blocks=small_blocks)
+        assert small_blocks.index.lookup(search.automaton).tolist() == rows, pattern
+
+
+def test_expansion_matches_brute_force(small_blocks, cases):
+    for pattern, (rows, numbers, number_rows) in cases.items():
+        search = lightning_searcher.LightningSearch(pattern, print_data=False, blocks=small_blocks)
+        expanded, expanded_rows = search.expand_rows(np.asarray(rows, dtype=np.int64))
+        assert expanded.tolist() == numbers, pattern
+        assert expanded_rows.tolist() == number_rows, pattern
+
+
+def test_expansion_stays_in_its_blocks(small_blocks):
+    # An exchange wide pattern must only give numbers of the blocks the report lists
+    search = lightning_searcher.search(small_patterns(small_blocks)[0], include_contaminated=True,
+                                       blocks=small_blocks)
+    numbers, number_rows = search.expand_rows(search.rows)
+    assert len(numbers) == 1000 * len(search.rows)
+    assert (small_blocks.index.number_rows(numbers) == number_rows).all()
+
+
+def test_chunks_and_pieces_cover_the_expansion(small_blocks):
+    search = lightning_searcher.search('XXXXXXX555', include_contaminated=True, blocks=small_blocks)
+    numbers, _ = search.expand_rows(search.rows)
+    chunked = np.concatenate([chunk for chunk, _ in search.iter_chunks(chunk_size=7)])
+    assert chunked.tolist() == numbers.tolist()
+    assert search.total_numbers() == len(numbers)
+
+
+def test_number_rows_matches_blocks(blocks):
+    rng = np.random.default_rng(0)
+    rows = rng.choice(len(blocks), 500)
+    numbers = np.array([rng.choice(block_numbers(blocks, row)) for row in rows])
+    assert (blocks.index.number_rows(numbers) == rows).all()
+    assert (blocks.index.number_rows(np.array([-1, 10 ** 10])) == -1).all()
+
+
+def test_ranges_to_rows():
+    starts, stops = np.array([5, 0, 9]), np.array([7, 0, 12])
+    assert block_index.ranges_to_rows(starts, stops).tolist() == [5, 6, 9, 10, 11]
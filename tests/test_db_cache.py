@@ -0,0 +1,66 @@
+# Cache round trip and rebuilds
+import os
+import numpy as np
+
+import db_cache
+import synthetic_data
+
+
+def report_frame(scale, seed):
+    # The synthetic report as the cache should decode it, in cache row order
+    frame = synthetic_data.generate_report(scale, seed)
+    frame.columns = db_cache.COLUMN_NAMES
+    frame = frame.sort_values(['NPA', 'NXX', 'x'], kind='stable').reset_index(drop=True)
+    frame = frame.astype(object)
+    return frame.where(frame != 'NONE', None)
+
+
+def test_round_trip(report, blocks):
+    frame = report_frame(0.01, 1)
+    assert len(blocks) == len(frame)
+    for column in db_cache.COLUMN_NAMES:
+        assert blocks.decode(column).tolist() == frame[column].tolist(), column
+
+
+def test_rows_are_sorted(blocks):
+    keys = db_cache.block_keys(blocks.columns)
+    assert (np.diff(keys) > 0).all()
+
+
+def test_reopened_cache_is_identical(report, blocks):
+    reopened = db_cache.BlockTable.open(db_cache.cache_path_for(report))
+    assert reopened.dictionaries == blocks.dictionaries
+    for column in db_cache.COLUMN_NAMES:
+        assert np.array_equal(reopened.columns[column], blocks.columns[column]), column
+
+
+def test_unchanged_report_is_not_rebuilt(tmp_path):
+    datafile = str(tmp_path / 'phone_numbers.csv')
+    synthetic_data.write_report(datafile, scale=0.002, seed=3)
+    db_cache.load_cache(datafile)
+    meta_file = os.path.join(db_cache.cache_path_for(datafile), 'meta.json')
+    built = os.stat(meta_file).st_mtime_ns
+
+    db_cache.load_cache(datafile)
+    assert os.stat(meta_file).st_mtime_ns == built
+    assert not os.path.exists(db_cache.previous_path_for(db_cache.cache_path_for(datafile)))
+
+
+def test_changed_report_is_rebuilt(tmp_path):
+    datafile = str(tmp_path / 'phone_numbers.csv')
+    synthetic_data.write_report(datafile, scale=0.002, seed=3)
+    db_cache.load_cache(datafile)
+
+    synthetic_data.write_report(datafile, scale=0.002, seed=4)
+    rebuilt = db_cache.load_cache(datafile)
+    frame = report_frame(0.002, 4)
+    for column in ('NPA', 'NXX', 'x', 'carrier'):
+        assert rebuilt.decode(column).tolist() == frame[column].tolist(), column
+
+
+def test_cache_without_report_is_trusted(tmp_path):
+    datafile = str(tmp_path / 'phone_numbers.csv')
+    synthetic_data.write_report(datafile, scale=0.002, seed=3)
+    built = db_cache.load_cache(datafile)
+    os.remove(datafile)
+    assert len(db_cache.load_cache(datafile)) == len(built)
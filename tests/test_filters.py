@@ -0,0 +1,35 @@
+# Filter semantics: any positive filter on a column, none of the negated ones
+import numpy as np
+
+import filters
+
+
+def matching(blocks, *options, mode='exact'):
+    rows = np.arange(len(blocks))
+    column_filters = [filters.ColumnFilter.parse('state', text, mode) for text in options]
+    return set(filters.apply_filters(blocks, rows, column_filters).tolist())
+
+
+def state_rows(blocks, state):
+    return set((blocks.decode('state') == state).nonzero()[0].tolist())
+
+
+def test_repeated_filters_are_alternatives(blocks):
+    first, second = sorted(set(blocks.decode('state').tolist()))[:2]
+    assert matching(blocks, first, second) == state_rows(blocks, first) | state_rows(blocks, second)
+
+
+def test_negated_filters_all_apply(blocks):
+    first, second = sorted(set(blocks.decode('state').tolist()))[:2]
+    everything = set(range(len(blocks)))
+    assert matching(blocks, '!' + first, '!' + second) == everything - state_rows(blocks, first) - state_rows(blocks, second)
+    assert matching(blocks, first, second, '!' + second) == state_rows(blocks, first)
+
+
+def test_columns_are_combined(blocks):
+    state = blocks.decode('state')[0]
+    carrier = blocks.decode('carrier')[0]
+    rows = np.arange(len(blocks))
+    column_filters = [filters.ColumnFilter('state', state, 'exact'), filters.ColumnFilter('carrier', carrier, 'exact')]
+    expected = (blocks.decode('state') == state) & (blocks.decode('carrier') == carrier)
+    assert filters.apply_filters(blocks, rows, column_filters).tolist() == expected.nonzero()[0].tolist()
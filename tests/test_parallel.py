@@ -0,0 +1,66 @@
+# Parallel and batch output, byte for byte against the in-process stream
+import io
+import pytest
+
+import batch
+import lightning_searcher
+import parallel
+import streaming
+
+FORMATS = sorted(streaming.WRITERS)
+
+
+def in_process(search, output_format, tag=None):
+    output = io.StringIO()
+    search.write_stream(output, output_format, tag=tag)
+    return output.getvalue().encode('utf-8')
+
+
+def busiest_npa(blocks):
+    npas = blocks.decode('NPA')
+    return max(set(npas.tolist()), key=npas.tolist().count)
+
+
+@pytest.mark.parametrize('output_format', FORMATS)
+def test_parallel_stream_is_byte_identical(blocks, tmp_path, output_format):
+    search = lightning_searcher.search(f"{busiest_npa(blocks)}[2-3]XXXXXX", blocks=blocks)
+    output = str(tmp_path / 'numbers.out')
+    # Small shards, so the pool has many of them to put back in order
+    written = parallel.stream_parallel(search, output, output_format, jobs=3, shard_size=20000)
+
+    with open(output, 'rb') as result:
+        assert result.read() == in_process(search, output_format)
+    assert written == search.total_numbers() > 20000
+
+
+def test_tagged_parallel_stream_is_byte_identical(blocks, tmp_path):
+    pattern = f"{busiest_npa(blocks)}2XX[0-4]XXX"
+    search = lightning_searcher.search(pattern, blocks=blocks)
+    output = str(tmp_path / 'numbers.csv')
+    parallel.stream_parallel(search, output, jobs=2, tag=pattern, shard_size=5000)
+
+    with open(output, 'rb') as result:
+        assert result.read() == in_process(search, 'csv', tag=pattern)
+
+
+@pytest.mark.parametrize('jobs', [1, 3])
+def test_batch_keeps_input_order(report, blocks, tmp_path, monkeypatch, jobs):
+    # Small groups and shards, so patterns span groups and the wide one is split
+    # (workers are forked, so they see the patched sizes)
+    monkeypatch.setattr(batch, 'PATTERNS_PER_TASK', 2)
+    monkeypatch.setattr(parallel, 'SHARD_SIZE', 20000)
+    npa = busiest_npa(blocks)
+    nxx = sorted(set(blocks.decode('NXX')[blocks.decode('NPA') == npa].tolist()))
+    patterns = [f"{npa}{nxx[1]}XXXX", f"{npa}{nxx[0]}XXXX", 'not a number', f"{npa}{nxx[1]}XXXX",
+                f"{npa}2XX[0-4]XXX", f"{npa}{nxx[2]}XXX5"]
+    output = str(tmp_path / 'batch.jsonl')
+    searched = batch.run_batch(patterns, output, jobs=jobs, datafile=report)
+
+    expected = io.StringIO()
+    streaming.WRITERS['jsonl'](expected, blocks, lightning_searcher.TABLE_HEADERS[1:], tag='').close()
+    valid = [pattern for pattern in patterns if pattern != 'not a number']
+    for pattern in valid:
+        lightning_searcher.search(pattern, blocks=blocks).write_stream(expected, 'jsonl', tag=pattern, header=False)
+    with open(output, 'r', encoding='utf-8') as result:
+        assert result.read() == expected.getvalue()
+    assert searched == len(valid)
@@ -0,0 +1,69 @@
+# Pattern syntax, checked against the same patterns as Python regexes
+import numpy as np
+import pytest
+
+import patterns
+from conftest import pattern_regex
+
+PATTERNS = [
+    'XXXX',
+    '1234',
+    '12X4',
+    '[2-5]XX[^0]',
+    '[0-35-9]X[13579]X',
+    '[^0-8]XXX',
+    '(12|34)XX',
+    '12XX|3[0-2]X9',
+    '(1|2)(3|4)[5-6]X',
+    '((1|2)3|45)XX',
+    '(12|1[2-3])XX',
+    'XX(0X|X0)'
+]
+
+INVALID = [
+    '123',
+    '12345',
+    '12X4|123',
+    '12A4',
+    '[]XXX',
+    '[^0-9]XXX',
+    '[5-2]XXX',
+    '[2-5XXX',
+    '(12XX',
+    '12XX)',
+    '12x4'
+]
+
+
+@pytest.mark.parametrize('pattern', PATTERNS)
+def test_accepted_matches_regex(pattern):
+    regex = pattern_regex(pattern)
+    expected = [number for number in range(10 ** 4) if regex.fullmatch(f"{number:04d}")]
+    automaton = patterns.compile_pattern(pattern, length=4)
+    assert automaton.accepted(4).tolist() == expected
+
+
+@pytest.mark.parametrize('pattern', PATTERNS)
+def test_walk_matches_regex(pattern):
+    regex = pattern_regex(pattern)
+    values = np.arange(10 ** 4)
+    automaton = patterns.compile_pattern(pattern, length=4)
+    matched = automaton.walk(values, 4) >= 0
+    assert matched.tolist() == [bool(regex.fullmatch(f"{value:04d}")) for value in values]
+
+
+@pytest.mark.parametrize('pattern', INVALID)
+def test_invalid_patterns_are_refused(pattern):
+    with pytest.raises(ValueError):
+        patterns.parse(pattern, length=4)
+
+
+def test_too_many_alternatives_are_refused():
+    with pytest.raises(ValueError):
+        patterns.parse('(0|1|2)' * 9, length=9)
+
+
+def test_automaton_is_minimal():
+    # Every alternative ends the same way, so the last four digits share one chain of states
+    automaton = patterns.compile_pattern('(312|773|415)555XXXX')
+    assert [len(table) for table in automaton.transitions] == [1, 3, 3, 1, 1, 1, 1, 1, 1, 1]
@@ -0,0 +1,24 @@
+# Stage records, and ranking nested in the stage that consumes it
+import lightning_searcher
+import profiler
+
+
+def test_nested_stages_stay_out_of_the_total():
+    stage_profiler = profiler.StageProfiler()
+    with stage_profiler.stage('render'):
+        with stage_profiler.stage('rank'):
+            pass
+    rank, render = stage_profiler.records
+    assert (rank['parent'], render['parent']) == ('render', None)
+    assert stage_profiler.total_seconds() == render['seconds']
+
+
+def test_rank_counts_blocks_in_and_out(blocks):
+    stage_profiler = profiler.StageProfiler()
+    search = lightning_searcher.search(f"{blocks.decode('NPA')[0]}XXXXXXX", blocks=blocks, profiler=stage_profiler)
+    with search.stage('render'):
+        numbers = sum(len(chunk) for chunk, _ in search.iter_ranked(top=5))
+    rank = next(record for record in stage_profiler.records if record['stage'] == 'rank')
+    assert numbers == 5
+    assert rank['parent'] == 'render'
+    assert rank['rows_in'] == len(search.rows) > rank['rows_out'] >= 1
@@ -0,0 +1,125 @@
+# Database refresh from a local HTTP server: not modified, changed, rejected and rolled back
+import io
+import os
+import threading
+import zipfile
+import http.server
+import pytest
+
+import db_cache
+import db_downloader
+import synthetic_data
+
+
+def zipped(frame) -> bytes:
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED) as zip_ref:
+        zip_ref.writestr('AllBlocksAugmentedReport.txt', frame.to_csv(index=False))
+    return archive.getvalue()
+
+
+class ReportServer:
+    """
+    Serves one zipped report with an ETag, answering 304 when the client already has it
+    """
+
+    def __init__(self):
+        self.body = b''
+        self.etag = None
+        self.requests = []
+        owner = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                owner.requests.append(dict(self.headers))
+                if owner.etag is not None and self.headers.get('If-None-Match') == owner.etag:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header('Content-Length', str(len(owner.body)))
+                self.send_header('ETag', owner.etag)
+                self.end_headers()
+                self.wfile.write(owner.body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/AllBlocksAugmentedReport.zip"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def publish(self, frame, etag):
+        self.body = zipped(frame)
+        self.etag = etag
+
+
+@pytest.fixture
+def server():
+    report_server = ReportServer()
+    yield report_server
+    report_server.httpd.shutdown()
+    report_server.httpd.server_close()
+
+
+def carriers(datafile):
+    return db_cache.load_cache(datafile).decode('carrier').tolist()
+
+
+def expected_carriers(frame):
+    frame = frame.sort_values(['NPA', 'NXX', 'X'], kind='stable')
+    return [None if carrier == 'NONE' else carrier for carrier in frame['OCN Name'].tolist()]
+
+
+def test_update_rollback_cycle(tmp_path, server):
+    datafile = str(tmp_path / 'phone_numbers.csv')
+    synthetic_data.write_report(datafile, scale=0.002, seed=3)
+    original = carriers(datafile)
+
+    # A changed report replaces the cache, the CSV on disk stays as it was
+    changed = synthetic_data.generate_report(scale=0.002, seed=3)
+    changed.loc[:9, 'OCN Name'] = 'TEST CARRIER'
+    changed = changed[:-5]
+    server.publish(changed, '"v2"')
+    changes = db_downloader.update_database(datafile, server.url)
+    assert changes['removed'] == 5
+    assert changes['changed'] == 10
+    assert carriers(datafile) == expected_carriers(changed)
+
+    # Same ETag: the server answers 304 and nothing is downloaded
+    assert db_downloader.update_database(datafile, server.url) is None
+    assert server.requests[-1]['If-None-Match'] == '"v2"'
+    assert carriers(datafile) == expected_carriers(changed)
+
+    # A report far smaller than the current one is refused and the cache kept
+    server.publish(changed[:10], '"v3"')
+    with pytest.raises(ValueError):
+        db_downloader.update_database(datafile, server.url)
+    assert carriers(datafile) == expected_carriers(changed)
+
+    # Rolling back goes to the cache built from the CSV, twice comes back
+    db_downloader.rollback_database(datafile)
+    assert carriers(datafile) == original
+    db_downloader.rollback_database(datafile)
+    assert carriers(datafile) == expected_carriers(changed)
+
+
+def test_first_update_over_an_existing_csv_is_kept(tmp_path, server):
+    # The CSV is there but was never cached: the update has to win over it
+    datafile = str(tmp_path / 'phone_numbers.csv')
+    synthetic_data.write_report(datafile, scale=0.002, seed=3)
+    newer = synthetic_data.generate_report(scale=0.002, seed=4)
+    server.publish(newer, '"v1"')
+
+    changes = db_downloader.update_database(datafile, server.url)
+    assert changes['added'] == len(newer)
+    assert carriers(datafile) == expected_carriers(newer)
+    assert not os.path.exists(db_cache.previous_path_for(db_cache.cache_path_for(datafile)))
+
+
+def test_rollback_without_snapshot_fails(tmp_path):
+    datafile = str(tmp_path / 'phone_numbers.csv')
+    synthetic_data.write_report(datafile, scale=0.002, seed=3)
+    db_cache.load_cache(datafile)
+    with pytest.raises(FileNotFoundError):
+        db_downloader.rollback_database(datafile)